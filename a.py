@@ -88,5 +88,5 @@ lexicon_a=[('a','art'),
 	('at','pre')
 	]
 
-print lexicon_a
-	
+if __name__ == "__main__":
+	print(lexicon_a)
@@ -0,0 +1,296 @@
+import argparse
+import json
+import mmap
+import os
+import sys
+import time
+
+from conllu import format_conllu
+
+CHECKPOINT_FILENAME = "checkpoint.json"
+
+CHECKPOINT_VERSION = 1
+
+DEFAULT_BATCH_SIZE = 1000
+
+DEFAULT_SHARD_SIZE = 100000
+
+JOB_KINDS = ("parse", "realize", "realize-plans")
+
+
+class MappedSentenceSource(object):
+    def __init__(self, sentence_filename):
+        """
+        Memory-mapped file of sentences, one per line, read by byte offset.
+
+        Only the pages of the lines actually read are touched, so starting at an offset deep into
+        a large corpus costs nothing, and the offset after each line is an exact resume point.
+
+        :param sentence_filename: path to the sentence file
+        :type sentence_filename: str
+        """
+        self.sentence_filename = sentence_filename
+        self._file = open(sentence_filename, 'rb')
+        self.size = os.fstat(self._file.fileno()).st_size
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    def read_batch(self, offset, count):
+        """
+        :param offset: byte offset to start reading at, 0 or an offset returned by an earlier call
+        :type offset: int
+        :param count: maximum number of sentences to read; blank lines are skipped and not counted
+        :type count: int
+        :return: the sentences read, without their line endings, and the byte offset after them
+        :rtype: tuple
+        """
+        sentences = []
+        data = self._map
+        size = self.size
+        while offset < size and len(sentences) < count:
+            end = data.find(b"\n", offset)
+            next_offset = size if end == -1 else end + 1
+            line = data[offset:next_offset].rstrip(b"\r\n")
+            offset = next_offset
+            if line.strip():
+                sentences.append(line.decode('utf-8'))
+        return sentences, offset
+
+    def close(self):
+        if self.size:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def _write_atomically(filename, content):
+    temporary_filename = filename + ".tmp"
+    with open(temporary_filename, 'w') as temporary_file:
+        temporary_file.write(content)
+        temporary_file.flush()
+        os.fsync(temporary_file.fileno())
+    os.replace(temporary_filename, filename)
+
+
+class BatchJob(object):
+    def __init__(self, sentence_filename, output_directory, process_batch, shard_suffix=".txt",
+                 batch_size=DEFAULT_BATCH_SIZE, shard_size=DEFAULT_SHARD_SIZE, report=None):
+        """
+        Runs a batch function over a sentence file into append-only output shards, checkpointing
+        after every batch so that an interrupted job resumes exactly where it stopped.
+
+        Each batch is appended to the current shard and synced to disk before the checkpoint is
+        replaced atomically with the input offset and shard size after it. On resume, anything a
+        crash left in the shard beyond the checkpointed size is truncated away, so every sentence
+        is written exactly once however often the job is interrupted.
+
+        :param sentence_filename: path to the input, one sentence per line
+        :type sentence_filename: str
+        :param output_directory: where the shards and the checkpoint go; created if missing
+        :type output_directory: str
+        :param process_batch: turns a list of sentences into one output string per sentence
+        :type process_batch: callable
+        :param shard_suffix: file name suffix of the shards
+        :type shard_suffix: str
+        :param batch_size: number of sentences processed between checkpoints
+        :type batch_size: int
+        :param shard_size: number of sentences per shard
+        :type shard_size: int
+        :param report: called with (shard name, sentence count, seconds) when a shard is finished;
+                       defaults to printing the shard's throughput
+        :type report: callable
+        """
+        self.sentence_filename = sentence_filename
+        self.output_directory = output_directory
+        self.process_batch = process_batch
+        self.shard_suffix = shard_suffix
+        self.batch_size = batch_size
+        self.shard_size = shard_size
+        self.report = report if report is not None else _print_shard_report
+        self.checkpoint_filename = os.path.join(output_directory, CHECKPOINT_FILENAME)
+
+    def shard_filename(self, shard):
+        return os.path.join(self.output_directory, "shard-{:05d}{}".format(shard, self.shard_suffix))
+
+    def _input_identity(self):
+        input_stat = os.stat(self.sentence_filename)
+        return {"input": os.path.abspath(self.sentence_filename), "input_size": input_stat.st_size,
+                "input_mtime_ns": input_stat.st_mtime_ns}
+
+    def load_checkpoint(self):
+        """
+        :return: the saved progress, or the starting state of a new job
+        :rtype: dict
+        :raises ValueError: if the checkpoint belongs to another input or to a changed input file
+        """
+        identity = self._input_identity()
+        if not os.path.exists(self.checkpoint_filename):
+            return dict(identity, version=CHECKPOINT_VERSION, offset=0, sentences=0, shard=0, shard_sentences=0,
+                        shard_bytes=0, shard_seconds=0.0, done=False)
+        with open(self.checkpoint_filename, 'r') as checkpoint_file:
+            checkpoint = json.load(checkpoint_file)
+        if checkpoint.get("version") != CHECKPOINT_VERSION:
+            raise ValueError("{}: unsupported checkpoint version {}".format(
+                self.checkpoint_filename, checkpoint.get("version")))
+        for key, value in identity.items():
+            if checkpoint[key] != value:
+                raise ValueError("{}: the checkpoint was made for a different {} ({} instead of {})".format(
+                    self.checkpoint_filename, key, checkpoint[key], value))
+        return checkpoint
+
+    def run(self):
+        """
+        Runs the job to the end of the input, resuming from the checkpoint if there is one.
+
+        :return: the final checkpoint
+        :rtype: dict
+        """
+        os.makedirs(self.output_directory, exist_ok=True)
+        checkpoint = self.load_checkpoint()
+        if checkpoint["done"]:
+            return checkpoint
+        self._discard_uncheckpointed_output(checkpoint)
+        with MappedSentenceSource(self.sentence_filename) as source:
+            shard_file = open(self.shard_filename(checkpoint["shard"]), 'ab')
+            try:
+                shard_start_time = time.time() - checkpoint["shard_seconds"]
+                while True:
+                    count = min(self.batch_size, self.shard_size - checkpoint["shard_sentences"])
+                    sentences, offset = source.read_batch(checkpoint["offset"], count)
+                    if sentences:
+                        outputs = self.process_batch(sentences)
+                        if len(outputs) != len(sentences):
+                            raise ValueError("batch function returned {} outputs for {} sentences".format(
+                                len(outputs), len(sentences)))
+                        shard_file.write("".join(outputs).encode('utf-8'))
+                        shard_file.flush()
+                        os.fsync(shard_file.fileno())
+                    checkpoint["offset"] = offset
+                    checkpoint["sentences"] += len(sentences)
+                    checkpoint["shard_sentences"] += len(sentences)
+                    checkpoint["shard_bytes"] = shard_file.tell()
+                    checkpoint["shard_seconds"] = time.time() - shard_start_time
+                    finished = offset >= source.size
+                    if checkpoint["shard_sentences"] >= self.shard_size or finished and checkpoint["shard_sentences"]:
+                        self.report(os.path.basename(self.shard_filename(checkpoint["shard"])),
+                                    checkpoint["shard_sentences"], checkpoint["shard_seconds"])
+                        if not finished:
+                            shard_file.close()
+                            checkpoint.update(shard=checkpoint["shard"] + 1, shard_sentences=0, shard_bytes=0,
+                                              shard_seconds=0.0)
+                            shard_file = open(self.shard_filename(checkpoint["shard"]), 'ab')
+                            shard_start_time = time.time()
+                    checkpoint["done"] = finished
+                    _write_atomically(self.checkpoint_filename, json.dumps(checkpoint, indent=2, sort_keys=True))
+                    if finished:
+                        return checkpoint
+            finally:
+                shard_file.close()
+
+    def _discard_uncheckpointed_output(self, checkpoint):
+        shard_filename = self.shard_filename(checkpoint["shard"])
+        if os.path.exists(shard_filename) and os.path.getsize(shard_filename) > checkpoint["shard_bytes"]:
+            with open(shard_filename, 'r+b') as shard_file:
+                shard_file.truncate(checkpoint["shard_bytes"])
+        later_shard = checkpoint["shard"] + 1
+        while os.path.exists(self.shard_filename(later_shard)):
+            os.remove(self.shard_filename(later_shard))
+            later_shard += 1
+
+
+def _print_shard_report(shard_name, sentence_count, seconds):
+    print("{}: {} sentences in {:.3f} seconds, {:.0f} sentences/second".format(
+        shard_name, sentence_count, seconds, sentence_count / seconds if seconds else float('inf')), file=sys.stderr)
+
+
+def _one_line(realization):
+    return " ".join(realization.split()) + "\n"
+
+
+def parse_job_batch(parser_backend):
+    """
+    :param parser_backend: the parser to use
+    :type parser_backend: parser_backends.ParserBackend
+    :return: a batch function writing each sentence's parse as a CoNLL-U block
+    """
+    def process_batch(sentences):
+        return [format_conllu(sentence, deptree)
+                for sentence, deptree in zip(sentences, parser_backend.parse_batch(sentences))]
+    return process_batch
+
+
+def realize_job_batch(parser_backend, with_stemming=False, with_morphology=False):
+    """
+    :param parser_backend: the parser to use
+    :type parser_backend: parser_backends.ParserBackend
+    :return: a batch function parsing and realizing each sentence, writing one realization per line
+    """
+    from ste_realization import realize_batch
+
+    def process_batch(sentences):
+        return [_one_line(realization) for realization in realize_batch(
+            parser_backend.parse_batch(sentences), with_stemming, with_morphology=with_morphology)]
+    return process_batch
+
+
+def realize_plans_job_batch(with_stemming=False, with_morphology=False):
+    """
+    :return: a batch function realizing pred-logic sentence plans, writing one realization per line
+    """
+    from sentplan_compiler import realize_plans
+
+    def process_batch(plans):
+        return [_one_line(realization) for realization in realize_plans(plans, with_stemming, with_morphology)]
+    return process_batch
+
+
+if __name__ == "__main__":
+    from parser_backends import FixtureParserBackend, HTTPParserBackend, SpacyParserBackend
+
+    parser = argparse.ArgumentParser(
+        description="Parse or realize a sentence file into output shards, resuming from the last checkpoint.")
+    parser.add_argument("kind", choices=JOB_KINDS,
+                        help="parse sentences to CoNLL-U, parse and realize sentences, or realize pred-logic plans")
+    parser.add_argument("input", help="input file, one sentence or plan per line")
+    parser.add_argument("output_directory", help="where the shards and the checkpoint are written")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of sentences processed between checkpoints")
+    parser.add_argument("--shard-size", type=int, default=DEFAULT_SHARD_SIZE, help="number of sentences per shard")
+    parser.add_argument("--fixture", help="parse from this CoNLL-U file instead of spaCy")
+    parser.add_argument("--parser-url", help="parse with the HTTP parser service at this URL instead of spaCy")
+    parser.add_argument("--stem", action="store_true", help="stem node labels when realizing")
+    parser.add_argument("--morphology", action="store_true", help="inflect nodes with a form feature when realizing")
+    args = parser.parse_args()
+
+    backend = None
+    if args.kind == "realize-plans":
+        batch_function = realize_plans_job_batch(args.stem, args.morphology)
+    else:
+        if args.fixture:
+            backend = FixtureParserBackend(args.fixture)
+        elif args.parser_url:
+            backend = HTTPParserBackend(args.parser_url)
+        else:
+            backend = SpacyParserBackend()
+        backend.load()
+        if args.kind == "parse":
+            batch_function = parse_job_batch(backend)
+        else:
+            batch_function = realize_job_batch(backend, args.stem, args.morphology)
+    job = BatchJob(args.input, args.output_directory, batch_function, ".conllu" if args.kind == "parse" else ".txt",
+                   args.batch_size, args.shard_size)
+    start_time = time.time()
+    try:
+        first_sentence = job.load_checkpoint()["sentences"]
+        final_checkpoint = job.run()
+    finally:
+        if backend is not None:
+            backend.close()
+    print("{} sentences done, {} in this run, in {:.3f} seconds".format(
+        final_checkpoint["sentences"], final_checkpoint["sentences"] - first_sentence, time.time() - start_time),
+        file=sys.stderr)
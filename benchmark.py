@@ -0,0 +1,427 @@
+import argparse
+import gc
+import json
+import math
+import multiprocessing
+import os
+import pickle
+import platform
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from corpus import CorpusReader, write_corpus
+from deptree import DependencyTree
+from sentplan import parse_pred_logic_to_sp
+from ste_realization import realize, realize_noun_phrase
+
+DEFAULT_SIZES = (1000, 10000)
+
+DEFAULT_DEPTH = 1000
+
+# Size and count of the large synthetic trees
+LARGE_TREE_NODES = 1000
+
+LARGE_TREE_COUNT = 100
+
+DEFAULT_REPEATS = 3
+
+DEFAULT_MIN_PASS_SECONDS = 0.2
+
+# Separate interpreters to run the benchmarks in. How fast a stage runs varies more between processes
+# than between passes in one process, by up to half on a busy machine, so one process is not enough
+DEFAULT_PROCESSES = 5
+
+# The medians of five processes of unchanged code stay within 20% of each other on a quiet machine
+DEFAULT_TOLERANCE = 0.25
+
+# Tail latencies are noisier than throughput, so they get a wider tolerance of their own
+DEFAULT_P99_TOLERANCE = 1.0
+
+# Timed passes that get slower by less than this are timer and scheduler noise, whatever the relative change
+NOISE_FLOOR_SECONDS = 0.01
+
+NOISE_FLOOR_P99_MS = 1.0
+
+NOISE_FLOOR_MEMORY_BYTES = 64 * 1024
+
+# Characters with a meaning in pred-logic strings, replaced when turning tree labels into predicates
+_PRED_LOGIC_SPECIALS = re.compile(r"[(),:=\s]+")
+
+# Dependency labels used for synthetic trees, with the children each may take
+_SYNTHETIC_DEPENDENTS = {
+    "ROOT": ("nsubj", "dobj", "advmod", "advcl", "prep", "punct", "aux", "neg"),
+    "nsubj": ("det", "amod", "compound", "prep"),
+    "dobj": ("det", "amod", "compound", "prep", "cc", "conj"),
+    "conj": ("det", "amod", "compound"),
+    "advcl": ("mark", "nsubj", "dobj", "advmod", "aux"),
+    "prep": ("pobj", ),
+    "pobj": ("det", "amod", "compound"),
+}
+
+
+def synthetic_tree(random_state, words, depth=4):
+    """
+    :param random_state: source of randomness, for reproducible corpora
+    :type random_state: random.Random
+    :param words: words to label nodes with
+    :type words: list
+    :param depth: maximum depth of the tree
+    :type depth: int
+    :return: a random tree with spaCy-style dependency labels
+    :rtype: DependencyTree
+    """
+    root = DependencyTree(random_state.choice(words), features={"dependency_label": "ROOT"})
+    stack = [(root, depth)]
+    while stack:
+        node, remaining_depth = stack.pop()
+        dependents = _SYNTHETIC_DEPENDENTS.get(node.features["dependency_label"])
+        if not dependents or remaining_depth == 0:
+            continue
+        for _ in range(random_state.randint(1, 3)):
+            child = DependencyTree(random_state.choice(words),
+                                   features={"dependency_label": random_state.choice(dependents)})
+            node.append(child)
+            stack.append((child, remaining_depth - 1))
+    return root
+
+
+def large_tree(random_state, words, node_count=LARGE_TREE_NODES):
+    """
+    :return: a bushy tree of exactly ``node_count`` nodes, each attached to one of the last few nodes added
+    :rtype: DependencyTree
+    """
+    labels = sorted(set(label for dependents in _SYNTHETIC_DEPENDENTS.values() for label in dependents))
+    nodes = [DependencyTree(random_state.choice(words), features={"dependency_label": "ROOT"})]
+    for _ in range(node_count - 1):
+        child = DependencyTree(random_state.choice(words), features={"dependency_label": random_state.choice(labels)})
+        random_state.choice(nodes[-20:]).append(child)
+        nodes.append(child)
+    return nodes[0]
+
+
+def deep_tree(words, depth):
+    """
+    :return: a chain of conjunctions ``depth`` levels deep, each with a determiner
+    :rtype: DependencyTree
+    """
+    root = DependencyTree(words[0], features={"dependency_label": "ROOT"})
+    node = root
+    for level in range(depth):
+        child = DependencyTree(words[level % len(words)], features={"dependency_label": "conj"})
+        node.append(DependencyTree("the", features={"dependency_label": "det"}))
+        node.append(child)
+        node = child
+    return root
+
+
+def plan_for_tree(deptree):
+    """
+    :return: a pred-logic string with the same shape as the tree, for benchmarking the plan parser
+    :rtype: str
+    """
+    parts = []
+    stack = [deptree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            parts.append(node)
+            continue
+        label = _PRED_LOGIC_SPECIALS.sub("_", node.label()) or "_"
+        parts.append("{}:dep={}".format(label, node.features.get("dependency_label") or "_"))
+        if len(node):
+            stack.append(")")
+            for position in range(len(node) - 1, -1, -1):
+                stack.append(node[position])
+                if position:
+                    stack.append(",")
+            stack.append("(")
+    return "".join(parts)
+
+
+def measure(function, items, with_memory=True, repeats=DEFAULT_REPEATS, min_pass_seconds=DEFAULT_MIN_PASS_SECONDS):
+    """
+    Runs a function over every item, timing each call.
+
+    A first pass warms up caches and a second one sizes the timed passes: each goes over the items
+    as many times as it takes to run for about ``min_pass_seconds``, so that fast stages are not timed
+    over a few milliseconds of scheduler noise. The timed passes run with the garbage collector
+    off and each figure is the median over the repeats.
+
+    :param repeats: number of timed passes
+    :type repeats: int
+    :param min_pass_seconds: shortest duration of a timed pass
+    :type min_pass_seconds: float
+    :return: throughput, latency percentiles and, if requested, peak traced memory of another run
+    :rtype: dict
+    """
+    for item in items:
+        function(item)
+    start_time = time.perf_counter()
+    for item in items:
+        function(item)
+    loops = max(1, int(math.ceil(min_pass_seconds / max(time.perf_counter() - start_time, 1e-6))))
+    pass_seconds = []
+    percentiles = {"p50_ms": [], "p95_ms": [], "p99_ms": []}
+    for _ in range(repeats):
+        latencies = []
+        gc.collect()
+        # as in timeit, collections triggered by earlier stages' garbage are kept out of the timings
+        gc.disable()
+        try:
+            start_time = time.perf_counter()
+            for _ in range(loops):
+                for item in items:
+                    call_start = time.perf_counter()
+                    function(item)
+                    latencies.append(time.perf_counter() - call_start)
+            pass_seconds.append((time.perf_counter() - start_time) / loops)
+        finally:
+            gc.enable()
+        latencies.sort()
+        percentiles["p50_ms"].append(1000 * latencies[int(0.50 * (len(latencies) - 1))])
+        percentiles["p95_ms"].append(1000 * latencies[int(0.95 * (len(latencies) - 1))])
+        percentiles["p99_ms"].append(1000 * latencies[int(0.99 * (len(latencies) - 1))])
+    elapsed = _median(pass_seconds)
+    result = {
+        "items": len(items),
+        "repeats": repeats,
+        "loops": loops,
+        "seconds": elapsed,
+        "throughput": len(items) / elapsed if elapsed else float('inf'),
+    }
+    for name, values in percentiles.items():
+        result[name] = _median(values)
+    if with_memory:
+        tracemalloc.start()
+        for item in items:
+            function(item)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def _median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def _time_calls(function, repeats=1):
+    """
+    :return: the median of ``repeats`` calls
+    :rtype: dict
+    """
+    elapsed_times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        elapsed_times.append(time.perf_counter() - start_time)
+    return {"items": 1, "repeats": repeats, "seconds": _median(elapsed_times)}
+
+
+def iter_corpora(examples, words, sizes=DEFAULT_SIZES, depth=DEFAULT_DEPTH, seed=0):
+    """
+    Generates the benchmark corpora one at a time, so that only one is held in memory.
+
+    :return: generator over (corpus name, list of DependencyTrees) pairs
+    """
+    random_state = random.Random(seed)
+    yield "ste100", [deptree for _, deptree in examples]
+    for size in sizes:
+        yield "synthetic{}".format(size), [synthetic_tree(random_state, words) for _ in range(size)]
+    yield "nodes{}".format(LARGE_TREE_NODES), [large_tree(random_state, words) for _ in range(LARGE_TREE_COUNT)]
+    yield "deep{}".format(depth), [deep_tree(words, depth)]
+
+
+def run_benchmarks(corpus_filename="ste100.pickle", sentence_filename="ste100.sents", sizes=DEFAULT_SIZES,
+                   depth=DEFAULT_DEPTH, with_spacy=False, with_memory=True, seed=0, repeats=DEFAULT_REPEATS,
+                   min_pass_seconds=DEFAULT_MIN_PASS_SECONDS):
+    """
+    Benchmarks the pipeline stages on the STE examples, on synthetic corpora of each size, on large
+    trees and on a deep tree.
+
+    :param repeats: number of timed passes per stage
+    :type repeats: int
+    :param min_pass_seconds: shortest duration of a timed pass
+    :type min_pass_seconds: float
+    :return: stage results keyed by ``stage/corpus``
+    :rtype: dict
+    """
+    results = {}
+
+    def run(stage, function, items):
+        results[stage] = measure(function, items, with_memory, repeats, min_pass_seconds)
+
+    with open(corpus_filename, 'rb') as corpus_file:
+        pickled_corpus = corpus_file.read()
+    run("pickle_load/ste100", pickle.loads, [pickled_corpus])
+    examples = pickle.loads(pickled_corpus)
+    words = set()
+    stack = [deptree for _, deptree in examples]
+    while stack:
+        node = stack.pop()
+        if node.label().strip():
+            words.add(node.label())
+        stack.extend(node)
+    words = sorted(words) or ["word"]
+
+    largest = "synthetic{}".format(max(sizes)) if sizes else "ste100"
+    for corpus_name, deptrees in iter_corpora(examples, words, sizes, depth, seed):
+        run("realize/" + corpus_name, realize, deptrees)
+        run("realize_noun_phrase/" + corpus_name, realize_noun_phrase, deptrees)
+        run("pformat/" + corpus_name, lambda deptree: deptree.pformat(), deptrees)
+        plans = [plan_for_tree(deptree) for deptree in deptrees]
+        run("parse_pred_logic_to_sp/" + corpus_name, lambda plan: parse_pred_logic_to_sp(plan, with_features=True),
+            plans)
+        del plans
+        if corpus_name == largest:
+            with tempfile.TemporaryDirectory() as corpus_directory:
+                corpus_path = os.path.join(corpus_directory, largest + ".corpus")
+                write_corpus(corpus_path, ((str(index), deptree) for index, deptree in enumerate(deptrees)))
+                del deptrees
+                results["corpus_open/" + largest] = _time_calls(lambda: CorpusReader(corpus_path).close(), repeats)
+                with CorpusReader(corpus_path) as reader:
+                    positions = list(range(len(reader)))
+                    random.Random(seed).shuffle(positions)
+                    run("corpus_random_access/" + largest, reader.__getitem__, positions)
+        else:
+            del deptrees
+
+    if with_spacy:
+        import load_from_spacy
+        results["spacy_load/en"] = _time_calls(lambda: load_from_spacy.get_en_nlp(parser_only=True))
+        en_nlp = load_from_spacy.get_en_nlp(parser_only=True)
+        with open(sentence_filename, 'r') as sentence_file:
+            docs = list(en_nlp.pipe(sentence_file))
+        run("from_spacy_sentence/ste100", load_from_spacy.from_spacy_sentence, docs)
+        run("from_spacy_doc/ste100", load_from_spacy.from_spacy_doc, docs)
+        run("from_spacy_doc_compact/ste100", lambda doc: load_from_spacy.from_spacy_doc(doc, compact=True), docs)
+    return results
+
+
+def run_in_processes(processes=DEFAULT_PROCESSES, **options):
+    """
+    Runs run_benchmarks once in each of several fresh interpreters, one after the other.
+
+    :param processes: number of interpreters
+    :type processes: int
+    :param options: keyword arguments for run_benchmarks
+    :return: stage results with each figure the median over the processes, and the lowest and
+             highest throughput, seconds and p99 latency seen in a ``_range`` entry next to it
+    :rtype: dict
+    """
+    context = multiprocessing.get_context("spawn")
+    runs = []
+    for _ in range(processes):
+        with context.Pool(1) as pool:
+            runs.append(pool.apply(run_benchmarks, (), options))
+    return merge_runs(runs)
+
+
+def merge_runs(runs):
+    """
+    :param runs: stage results of several run_benchmarks calls
+    :type runs: list
+    :return: the merged results, as described in run_in_processes; settings such as the number of
+             loops per pass come from the first run
+    :rtype: dict
+    """
+    merged = {}
+    for stage in runs[0]:
+        stage_results = [run[stage] for run in runs if stage in run]
+        merged[stage] = {key: value if key in _SETTINGS else _median([result[key] for result in stage_results])
+                         for key, value in stage_results[0].items()}
+        merged[stage]["processes"] = len(stage_results)
+        for key in "throughput", "seconds", "p99_ms":
+            if key in stage_results[0]:
+                values = [result[key] for result in stage_results]
+                merged[stage][key + "_range"] = [min(values), max(values)]
+    return merged
+
+
+# Entries of a stage result which describe how it was run rather than what was measured
+_SETTINGS = frozenset(["items", "repeats", "loops"])
+
+
+def compare(results, baseline, tolerance=DEFAULT_TOLERANCE, p99_tolerance=DEFAULT_P99_TOLERANCE):
+    """
+    Compares the medians over processes, which one slow process cannot move, and ignores changes
+    below the noise floors. The floor on time applies to a whole timed pass, which fast stages
+    make long enough to measure by going over their items several times.
+
+    :param results: stage results from run_benchmarks or run_in_processes
+    :param baseline: earlier results to compare against
+    :param tolerance: allowed relative slowdown, e.g. 0.25 for 25%
+    :param p99_tolerance: allowed relative growth of the p99 latency
+    :return: descriptions of the stages that regressed
+    :rtype: list
+    """
+    regressions = []
+    for stage, result in sorted(results.items()):
+        previous = baseline.get(stage)
+        if previous is None:
+            continue
+        slower = (result["seconds"] - previous["seconds"]) * result.get("loops", 1) > NOISE_FLOOR_SECONDS
+        if "throughput" in result and slower and result["throughput"] < previous["throughput"] * (1 - tolerance):
+            regressions.append("{}: throughput {:.1f}/s, baseline {:.1f}/s".format(
+                stage, result["throughput"], previous["throughput"]))
+        elif "throughput" not in result and slower and result["seconds"] > previous["seconds"] * (1 + tolerance):
+            regressions.append("{}: {:.3f}s, baseline {:.3f}s".format(stage, result["seconds"], previous["seconds"]))
+        if "p99_ms" in result \
+                and result["p99_ms"] > previous["p99_ms"] * (1 + p99_tolerance) + NOISE_FLOOR_P99_MS:
+            regressions.append("{}: p99 {:.3f}ms, baseline {:.3f}ms".format(stage, result["p99_ms"], previous["p99_ms"]))
+        if "peak_memory_bytes" in result and "peak_memory_bytes" in previous and result["peak_memory_bytes"] \
+                > previous["peak_memory_bytes"] * (1 + tolerance) + NOISE_FLOOR_MEMORY_BYTES:
+            regressions.append("{}: peak memory {} bytes, baseline {} bytes".format(
+                stage, result["peak_memory_bytes"], previous["peak_memory_bytes"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the realization pipeline stages.")
+    parser.add_argument("--corpus", default="ste100.pickle", help="pickled (sentence, DependencyTree) examples")
+    parser.add_argument("--sentences", default="ste100.sents", help="raw sentences for the spaCy stages")
+    parser.add_argument("--sizes", type=int, nargs="*", default=list(DEFAULT_SIZES),
+                        help="sizes of the synthetic corpora, e.g. 1000 100000 1000000")
+    parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="depth of the deep synthetic tree")
+    parser.add_argument("--spacy", action="store_true", help="also benchmark loading spaCy and converting its parses")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--repeats", type=int, default=DEFAULT_REPEATS,
+                        help="number of timed passes per stage, after the warm-up and sizing passes")
+    parser.add_argument("--min-pass-seconds", type=float, default=DEFAULT_MIN_PASS_SECONDS,
+                        help="shortest duration of a timed pass; fast stages go over their items several times")
+    parser.add_argument("--processes", type=int, default=DEFAULT_PROCESSES,
+                        help="number of fresh interpreters to run the benchmarks in (1 runs them in this one)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="allowed relative slowdown before a stage counts as regressed")
+    parser.add_argument("--p99-tolerance", type=float, default=DEFAULT_P99_TOLERANCE,
+                        help="allowed relative growth of the p99 latency before a stage counts as regressed")
+    args = parser.parse_args()
+
+    options = {"corpus_filename": args.corpus, "sentence_filename": args.sentences, "sizes": args.sizes,
+               "depth": args.depth, "with_spacy": args.spacy, "with_memory": not args.no_memory,
+               "repeats": args.repeats, "min_pass_seconds": args.min_pass_seconds}
+    if args.processes > 1:
+        results = run_in_processes(args.processes, **options)
+    else:
+        results = run_benchmarks(**options)
+    report = {"python": sys.version.split()[0], "platform": platform.platform(), "results": results}
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=2, sort_keys=True)
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            regressions = compare(results, json.load(baseline_file)["results"], args.tolerance,
+                                  args.p99_tolerance)
+        for regression in regressions:
+            print("REGRESSION " + regression, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
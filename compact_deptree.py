@@ -0,0 +1,209 @@
+from array import array
+
+from deptree import DependencyTree
+
+# Marks a node without a dependency_label feature, or the parent of the root
+NO_ID = -1
+
+
+class Vocabulary(object):
+    __slots__ = ("strings", "_ids")
+
+    def __init__(self, strings=None):
+        """
+        Interned string table shared by CompactDependencyTrees.
+
+        :param strings: strings to intern, in id order
+        :type strings: list
+        """
+        self.strings = []
+        self._ids = {}
+        if strings:
+            for string in strings:
+                self.intern(string)
+
+    def intern(self, string):
+        """
+        :param string: the string to look up, adding it if it is new
+        :type string: str
+        :return: the id of the string
+        :rtype: int
+        """
+        string_id = self._ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self._ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getstate__(self):
+        return self.strings
+
+    def __setstate__(self, strings):
+        self.__init__(strings)
+
+
+shared_vocabulary = Vocabulary()
+
+
+class CompactDependencyTree(object):
+    __slots__ = ("vocabulary", "heads", "labels", "dependency_labels", "extra_features")
+
+    def __init__(self, vocabulary, heads, labels, dependency_labels, extra_features=None):
+        """
+        Array-backed dependency tree for a whole sentence.
+
+        Nodes are stored in pre-order, so node 0 is the root and every node comes after its head
+        and after its preceding siblings.
+
+        :param vocabulary: the string table the label ids refer to
+        :type vocabulary: Vocabulary
+        :param heads: index of each node's head, NO_ID for the root
+        :type heads: array.array
+        :param labels: vocabulary id of each node's label
+        :type labels: array.array
+        :param dependency_labels: vocabulary id of each node's dependency_label feature, or NO_ID
+        :type dependency_labels: array.array
+        :param extra_features: node index to all of its features in their original order, for the few nodes
+                               with features other than dependency_label
+        :type extra_features: dict
+        """
+        self.vocabulary = vocabulary
+        self.heads = heads
+        self.labels = labels
+        self.dependency_labels = dependency_labels
+        self.extra_features = extra_features
+
+    @classmethod
+    def from_deptree(cls, deptree, vocabulary=None):
+        """
+        :param deptree: the tree to convert
+        :type deptree: DependencyTree
+        :param vocabulary: the string table to intern labels in; defaults to shared_vocabulary
+        :type vocabulary: Vocabulary
+        :rtype: CompactDependencyTree
+        """
+        if vocabulary is None:
+            vocabulary = shared_vocabulary
+        heads = array('i')
+        labels = array('i')
+        dependency_labels = array('i')
+        extra_features = None
+        stack = [(deptree, NO_ID)]
+        while stack:
+            node, head = stack.pop()
+            index = len(heads)
+            heads.append(head)
+            labels.append(vocabulary.intern(node.label()))
+            features = node.features
+            if "dependency_label" in features:
+                dependency_labels.append(vocabulary.intern(features["dependency_label"]))
+            else:
+                dependency_labels.append(NO_ID)
+            if len(features) > ("dependency_label" in features):
+                if extra_features is None:
+                    extra_features = {}
+                extra_features[index] = dict(features)
+            for child in reversed(node):
+                stack.append((child, index))
+        return cls(vocabulary, heads, labels, dependency_labels, extra_features)
+
+    def to_deptree(self):
+        """
+        :return: an equivalent DependencyTree
+        :rtype: DependencyTree
+        """
+        strings = self.vocabulary.strings
+        nodes = []
+        for index, head in enumerate(self.heads):
+            node = DependencyTree(strings[self.labels[index]], features=self.features(index))
+            nodes.append(node)
+            if head != NO_ID:
+                nodes[head].append(node)
+        return nodes[0]
+
+    def children(self):
+        """
+        :return: for each node, the list of its children's indices in order
+        :rtype: list
+        """
+        children = [[] for _ in self.heads]
+        for index, head in enumerate(self.heads):
+            if head != NO_ID:
+                children[head].append(index)
+        return children
+
+    def label(self, index=0):
+        return self.vocabulary.strings[self.labels[index]]
+
+    def dependency_label(self, index=0):
+        dependency_label = self.dependency_labels[index]
+        if dependency_label == NO_ID:
+            return None
+        return self.vocabulary.strings[dependency_label]
+
+    def features(self, index=0):
+        """
+        :return: a new dict of the node's features, in the order the original tree had them
+        :rtype: dict
+        """
+        return node_features(self.dependency_label(index), self.extra_features and self.extra_features.get(index))
+
+    def __len__(self):
+        return len(self.heads)
+
+    def __getstate__(self):
+        # Only the strings this tree uses are pickled, with ids local to the tree, so that sending
+        # trees to another process does not send the whole shared vocabulary along with them
+        strings = self.vocabulary.strings
+        local_ids = {}
+        labels = array('i', [local_ids.setdefault(label, len(local_ids)) for label in self.labels])
+        dependency_labels = array('i', [NO_ID if dependency_label == NO_ID
+                                        else local_ids.setdefault(dependency_label, len(local_ids))
+                                        for dependency_label in self.dependency_labels])
+        used_strings = [None] * len(local_ids)
+        for string_id, local_id in local_ids.items():
+            used_strings[local_id] = strings[string_id]
+        return used_strings, self.heads, labels, dependency_labels, self.extra_features
+
+    def __setstate__(self, state):
+        """
+        Unpickled trees intern their strings in the receiving process's shared_vocabulary.
+        """
+        strings, self.heads, labels, dependency_labels, self.extra_features = state
+        if isinstance(strings, Vocabulary):
+            # pickled with its whole vocabulary, as older versions did
+            self.vocabulary, self.labels, self.dependency_labels = strings, labels, dependency_labels
+            return
+        self.vocabulary = shared_vocabulary
+        ids = [shared_vocabulary.intern(string) for string in strings]
+        self.labels = array('i', [ids[label] for label in labels])
+        self.dependency_labels = array('i', [NO_ID if dependency_label == NO_ID else ids[dependency_label]
+                                             for dependency_label in dependency_labels])
+
+
+def node_features(dependency_label, features=None):
+    """
+    Rebuilds a node's feature dict from its stored parts.
+
+    :param dependency_label: the node's dependency_label feature, or None
+    :type dependency_label: str
+    :param features: all of the node's features in order, if it has others besides dependency_label;
+                     trees stored before the order was kept leave dependency_label out of these
+    :type features: dict
+    :return: the features, with dependency_label first unless ``features`` places it elsewhere
+    :rtype: dict
+    """
+    if features is None:
+        return {} if dependency_label is None else {"dependency_label": dependency_label}
+    if dependency_label is None or "dependency_label" in features:
+        return dict(features)
+    ordered = {"dependency_label": dependency_label}
+    ordered.update(features)
+    return ordered
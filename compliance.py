@@ -0,0 +1,202 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+
+from lexicon import get_lexicon
+from morphology import IRREGULAR_VERBS, VERB_TAGS, InflectionTable
+from parallel import DEFAULT_CHUNK_SIZE, map_chunks
+from term_matcher import TermMatcher
+
+# STE limits sentences in procedural text (instructions) and descriptive text to these many words
+PROCEDURAL_WORD_LIMIT = 20
+
+DESCRIPTIVE_WORD_LIMIT = 25
+
+# Values of the SentPlan mood feature STE allows on a sentence, and the infinitive allowed below it
+SENTENCE_MOODS = {"imp": "procedural", "imperative": "procedural", "decl": "descriptive", "declarative": "descriptive"}
+
+CLAUSE_MOODS = frozenset(["inf", "infinitive"])
+
+SUBJECT_LABELS = frozenset(["nsubj", "nsubjpass", "expl", "csubj"])
+
+# Dependency labels under which an -ing word is used as a noun
+NOMINAL_LABELS = frozenset(["nsubj", "nsubjpass", "dobj", "pobj", "pcomp", "attr", "appos", "conj", "csubj"])
+
+BE_FORMS = frozenset(["be", "is", "are", "am", "was", "were", "been", "being"])
+
+# A word is a whitespace-separated token with a letter or digit; punctuation does not count
+_WORD_PATTERN = re.compile(r"\S*[^\W_]\S*")
+
+Violation = namedtuple("Violation", ["rule", "word", "detail"])
+Violation.__doc__ = """
+One breach of an STE rule: the rule name, the word it concerns (or None) and a description.
+"""
+
+ComplianceReport = namedtuple("ComplianceReport", ["sentence", "sentence_type", "word_count", "violations"])
+ComplianceReport.__doc__ = """
+Result of checking one realized sentence; sentence_type is procedural or descriptive.
+"""
+
+
+class ComplianceChecker(object):
+    def __init__(self, lexicon=None):
+        """
+        Checks realized sentences and their DependencyTrees against the STE writing rules:
+        approved vocabulary, no progressive or gerund -ing forms, declarative or imperative
+        mood only, and the word limits for procedural and descriptive sentences.
+
+        :param lexicon: defaults to the shared STE lexicon
+        :type lexicon: lexicon.Lexicon
+        """
+        if lexicon is None:
+            lexicon = get_lexicon()
+        self.lexicon = lexicon
+        self.term_matcher = TermMatcher(lexicon)
+        # STE allows approved words in their inflected forms, e.g. "closes" for "close"
+        self.inflected_forms = frozenset(form.lower() for form in InflectionTable.from_lexicon(lexicon).strings)
+        # Only -ing forms of known verbs are verb forms; "string" and "bearing" are nouns
+        self.verbs = frozenset([word.lower() for word in lexicon.words()
+                                if any(tag in VERB_TAGS for tag in lexicon.pos_tags(word))] + list(IRREGULAR_VERBS))
+
+    def check(self, sentence, deptree):
+        """
+        :param sentence: the realized sentence
+        :type sentence: str
+        :param deptree: the tree it was realized from
+        :type deptree: DependencyTree
+        :rtype: ComplianceReport
+        """
+        inflected_forms = self.inflected_forms
+        violations = [Violation("vocabulary", word, "not in the STE dictionary")
+                      for _, word in self.term_matcher.match(sentence).unapproved
+                      if word.lower() not in inflected_forms]
+        pos_by_word = self.lexicon.pos_by_word
+
+        root_mood = deptree.features.get("mood")
+        has_subject = False
+        stack = [deptree]
+        while stack:
+            node = stack.pop()
+            features = node.features
+            mood = features.get("mood")
+            if mood is not None and node is not deptree and mood not in CLAUSE_MOODS and mood not in SENTENCE_MOODS:
+                violations.append(Violation("mood", node.label(), "mood '{}' is not allowed".format(mood)))
+            word = node.label().lower()
+            if len(word) > 4 and word.endswith("ing") and word not in pos_by_word and self._is_verb_ing(word):
+                violations.append(self._ing_violation(node))
+            for child in node:
+                if node is deptree and child.features.get("dependency_label") in SUBJECT_LABELS:
+                    has_subject = True
+                stack.append(child)
+
+        if root_mood is None:
+            sentence_type = "descriptive" if has_subject else "procedural"
+        elif root_mood in SENTENCE_MOODS:
+            sentence_type = SENTENCE_MOODS[root_mood]
+        else:
+            sentence_type = "descriptive"
+            violations.append(Violation("mood", deptree.label(),
+                                        "sentences must be declarative or imperative, not '{}'".format(root_mood)))
+        if sentence.rstrip().endswith("?"):
+            violations.append(Violation("mood", None, "questions are not declarative or imperative"))
+
+        word_count = len(_WORD_PATTERN.findall(sentence))
+        limit = PROCEDURAL_WORD_LIMIT if sentence_type == "procedural" else DESCRIPTIVE_WORD_LIMIT
+        if word_count > limit:
+            violations.append(Violation("length", None, "{} words in a {} sentence, the limit is {}".format(
+                word_count, sentence_type, limit)))
+        return ComplianceReport(sentence, sentence_type, word_count, violations)
+
+    def _is_verb_ing(self, word):
+        stem = word[:-3]
+        # closing, applying, stopping, lying
+        candidates = [stem, stem + "e", stem[:-1] + "ie"]
+        if len(stem) > 2 and stem[-1] == stem[-2]:
+            candidates.append(stem[:-1])
+        return any(candidate in self.verbs for candidate in candidates)
+
+    def _ing_violation(self, node):
+        if node.features.get("dependency_label") in NOMINAL_LABELS:
+            return Violation("gerund", node.label(), "-ing form used as a noun")
+        for child in node:
+            dep = child.features.get("dependency_label")
+            if dep in ("aux", "auxpass") and child.label().lower() in BE_FORMS:
+                return Violation("progressive", node.label(), "progressive tense")
+        return Violation("ing_form", node.label(), "-ing form outside a technical name")
+
+    def check_document(self, examples):
+        """
+        :param examples: (realized sentence, DependencyTree) pairs
+        :type examples: iterable
+        :return: generator over one ComplianceReport per sentence, as they are checked
+        """
+        for sentence, deptree in examples:
+            yield self.check(sentence, deptree)
+
+
+_worker_checker = None
+
+
+def _check_chunk(chunk):
+    global _worker_checker
+    if _worker_checker is None:
+        _worker_checker = ComplianceChecker()
+    return [_worker_checker.check(sentence, deptree) for sentence, deptree in chunk]
+
+
+def check_parallel(examples, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Checks a stream of (realized sentence, DependencyTree) pairs across a pool of worker processes.
+
+    Pairs are sent to the workers in chunks as described in parallel.map_chunks, so reports
+    stream back in input order without the whole document in memory.
+
+    :param examples: (realized sentence, DependencyTree) pairs
+    :type examples: iterable
+    :param processes: number of worker processes; defaults to one per CPU core
+    :type processes: int
+    :param chunk_size: number of sentences sent to a worker per task
+    :type chunk_size: int
+    :return: generator over ComplianceReports, in input order
+    """
+    return map_chunks(_check_chunk, examples, processes, chunk_size)
+
+
+if __name__ == "__main__":
+    from corpus import iter_examples
+    from ste_realization import realize
+
+    parser = argparse.ArgumentParser(description="Realize a corpus and check the output against the STE rules.")
+    parser.add_argument("corpus", nargs="?",
+                        help="binary or pickled (sentence, DependencyTree) examples "
+                             "(default: ste100.corpus, or the older ste100.pickle cache)")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="check in parallel with this many worker processes (0 for one per CPU core)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="number of sentences sent to a worker process at a time")
+    parser.add_argument("--all", action="store_true", help="report compliant sentences too")
+    args = parser.parse_args()
+    if args.corpus is None:
+        args.corpus = "ste100.pickle" if os.path.exists("ste100.pickle") and not os.path.exists("ste100.corpus") \
+            else "ste100.corpus"
+
+    realized = ((realize(deptree, with_stemming=False), deptree) for _, deptree in iter_examples(args.corpus))
+    if args.processes == 1:
+        reports = ComplianceChecker().check_document(realized)
+    else:
+        reports = check_parallel(realized, args.processes or None, args.chunk_size)
+    counts = Counter()
+    sentence_count = 0
+    start_time = time.time()
+    for sentence_count, report in enumerate(reports, 1):
+        counts.update(violation.rule for violation in report.violations)
+        if report.violations or args.all:
+            print(json.dumps({"sentence": report.sentence, "type": report.sentence_type, "words": report.word_count,
+                              "violations": [violation._asdict() for violation in report.violations]}))
+    elapsed = time.time() - start_time
+    print("Realized and checked {} sentences in {:.3f} seconds; violations: {}".format(
+        sentence_count, elapsed, dict(counts) or "none"), file=sys.stderr)
@@ -0,0 +1,245 @@
+from deptree import DependencyTree
+
+# Columns of a CoNLL-U token line
+CONLLU_COLUMNS = ("id", "form", "lemma", "upos", "xpos", "feats", "head", "deprel", "deps", "misc")
+
+# Columns kept as DependencyTree features besides deprel, which becomes dependency_label
+FEATURE_COLUMNS = ("lemma", "upos", "xpos", "feats", "deps", "misc")
+
+# MISC entry marking a row written with the escapes UD uses for SpacesAfter, for rows with tabs or line
+# breaks in any column, or with an empty value
+ESCAPED_ROW = "Escaped=Yes"
+
+_ESCAPES = {"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"}
+
+_UNESCAPES = {escaped[1]: character for character, escaped in _ESCAPES.items()}
+
+# An empty value in an escaped row, told apart from "_", which is a missing one
+_ESCAPED_EMPTY = "\\_"
+
+
+def _needs_escape(value):
+    return value == "" or "\t" in value or "\n" in value or "\r" in value
+
+
+def _escape(value):
+    if value is None:
+        return "_"
+    if value == "":
+        return _ESCAPED_EMPTY
+    return "".join(_ESCAPES.get(character, character) for character in value)
+
+
+def _unescape(value):
+    if value == _ESCAPED_EMPTY:
+        return ""
+    characters = []
+    position = 0
+    while position < len(value):
+        if value[position] == "\\" and position + 1 < len(value):
+            characters.append(_UNESCAPES.get(value[position + 1], value[position + 1]))
+            position += 2
+        else:
+            characters.append(value[position])
+            position += 1
+    return "".join(characters)
+
+
+def iter_conllu(conllu_filename, keep_ids=False):
+    """
+    Streams the sentences of a CoNLL-U file as (sentence, DependencyTree) examples.
+
+    The file is read one sentence at a time, so memory use does not depend on its size.
+
+    :param conllu_filename: path to the CoNLL-U file
+    :type conllu_filename: str
+    :param keep_ids: keep each token's position in an ``id`` feature, so write_conllu restores the word order
+    :type keep_ids: bool
+    :return: generator over (sentence, DependencyTree) pairs
+    """
+    with open(conllu_filename, 'r', encoding='utf-8') as conllu_file:
+        yield from iter_conllu_lines(conllu_file, keep_ids)
+
+
+def iter_conllu_lines(lines, keep_ids=False, columns=None):
+    """
+    Builds (sentence, DependencyTree) examples from lines in CoNLL-U format.
+
+    Each node is labelled with the token's form and gets its deprel as the dependency_label
+    feature and its other columns as features of the same name; columns holding ``_`` are
+    missing values and give no feature. Rows format_conllu escaped are unescaped. Children are kept in
+    token order. Multi-word token ranges and empty nodes are skipped. The sentence is taken
+    from the ``# text =`` comment if there is one, otherwise from the forms.
+
+    :param lines: lines of CoNLL-U, e.g. an open file
+    :type lines: iterable
+    :param keep_ids: keep each token's position in an ``id`` feature
+    :type keep_ids: bool
+    :param columns: names of the columns, for CoNLL dialects with a different layout
+    :type columns: tuple
+    :return: generator over (sentence, DependencyTree) pairs
+    """
+    if columns is None:
+        columns = CONLLU_COLUMNS
+    positions = {column: position for position, column in enumerate(columns)}
+    feature_positions = [(column, positions[column]) for column in FEATURE_COLUMNS if column in positions]
+    id_position, form_position = positions["id"], positions["form"]
+    head_position, deprel_position = positions["head"], positions["deprel"]
+    text = None
+    rows = []
+    line_number = 0
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line:
+            if rows:
+                yield _example_from_rows(text, rows, line_number, keep_ids, feature_positions,
+                                         id_position, form_position, head_position, deprel_position)
+            text = None
+            rows = []
+        elif line.startswith("#"):
+            if line.startswith("# text =") and not rows:
+                text = line[len("# text ="):].strip()
+        else:
+            row = line.split("\t")
+            if len(row) < len(columns):
+                raise ValueError("line {} has {} columns, expected {}".format(line_number, len(row), len(columns)))
+            if "-" in row[id_position] or "." in row[id_position]:
+                continue
+            rows.append(row)
+    if rows:
+        yield _example_from_rows(text, rows, line_number, keep_ids, feature_positions,
+                                 id_position, form_position, head_position, deprel_position)
+
+
+def _example_from_rows(text, rows, line_number, keep_ids, feature_positions,
+                       id_position, form_position, head_position, deprel_position):
+    nodes = {}
+    for row in rows:
+        form = row[form_position]
+        deprel = row[deprel_position]
+        values = [(column, row[position]) for column, position in feature_positions]
+        misc = dict(values).get("misc", "_")
+        if ESCAPED_ROW in misc.split("|"):
+            misc = "|".join(entry for entry in misc.split("|") if entry != ESCAPED_ROW) or "_"
+            values = [(column, misc if column == "misc" else value) for column, value in values]
+            unescape = _unescape
+        else:
+            unescape = None
+        features = {}
+        if deprel != "_":
+            features["dependency_label"] = unescape(deprel) if unescape else deprel
+        for column, value in values:
+            if value != "_":
+                features[column] = unescape(value) if unescape else value
+        if keep_ids:
+            features["id"] = row[id_position]
+        nodes[row[id_position]] = DependencyTree(unescape(form) if unescape else form, features=features)
+    roots = []
+    for row in rows:
+        node = nodes[row[id_position]]
+        if row[head_position] == "0":
+            roots.append(node)
+        else:
+            try:
+                nodes[row[head_position]].append(node)
+            except KeyError:
+                raise ValueError("token {} has unknown head {} in the sentence ending at line {}".format(
+                    row[id_position], row[head_position], line_number)) from None
+    if len(roots) != 1:
+        raise ValueError("sentence ending at line {} has {} roots".format(line_number, len(roots)))
+    if text is None:
+        text = " ".join(row[form_position] for row in rows)
+    return text, roots[0]
+
+
+def write_conllu(conllu_filename, examples):
+    """
+    Writes (sentence, DependencyTree) examples to a CoNLL-U file, one sentence at a time.
+
+    Tokens are numbered by their ``id`` features when every node has one, as iter_conllu
+    leaves them with ``keep_ids``, and in pre-order otherwise. Missing values are written as ``_``.
+    Rows with tabs or line breaks in any column, like the newline tokens spaCy makes of line ends,
+    or with an empty value are escaped and marked in MISC.
+
+    :param conllu_filename: path of the file to write
+    :type conllu_filename: str
+    :param examples: (sentence, DependencyTree) pairs
+    :type examples: iterable
+    """
+    with open(conllu_filename, 'w', encoding='utf-8') as conllu_file:
+        for sentence, deptree in examples:
+            conllu_file.write(format_conllu(sentence, deptree))
+
+
+def format_conllu(sentence, deptree):
+    """
+    :param sentence: the sentence text, written as the ``# text =`` comment unless it is None
+    :type sentence: str
+    :param deptree: the tree to write
+    :type deptree: DependencyTree
+    :return: the CoNLL-U block for one sentence, including the blank line ending it
+    :rtype: str
+    """
+    nodes = []
+    heads = []
+    stack = [(deptree, None)]
+    while stack:
+        node, head = stack.pop()
+        nodes.append(node)
+        heads.append(head)
+        stack.extend((child, node) for child in reversed(node))
+    if all("id" in node.features for node in nodes):
+        ids = {id(node): node.features["id"] for node in nodes}
+        order = sorted(range(len(nodes)), key=lambda index: int(ids[id(nodes[index])]))
+    else:
+        ids = {id(node): str(position) for position, node in enumerate(nodes, 1)}
+        order = range(len(nodes))
+    lines = []
+    if sentence is not None:
+        lines.append("# text = {}".format(sentence.strip()))
+    for index in order:
+        node = nodes[index]
+        head = heads[index]
+        features = node.features
+        values = [node.label(), features.get("lemma"), features.get("upos"), features.get("xpos"),
+                  features.get("feats"), features.get("dependency_label"), features.get("deps"), features.get("misc")]
+        if any(value is not None and _needs_escape(value) for value in values):
+            values = [_escape(value) for value in values]
+            values[-1] = ESCAPED_ROW if values[-1] == "_" else values[-1] + "|" + ESCAPED_ROW
+        else:
+            values = ["_" if value is None else value for value in values]
+        form, lemma, upos, xpos, feats, deprel, deps, misc = values
+        lines.append("\t".join((ids[id(node)], form, lemma, upos, xpos, feats,
+                                "0" if head is None else ids[id(head)], deprel, deps, misc)))
+    return "\n".join(lines) + "\n\n"
+
+
+if __name__ == "__main__":
+    import io
+    import sys
+
+    from corpus import iter_examples
+
+    # Checks that a corpus survives a round trip through CoNLL-U with identical trees and features
+    corpus_filename = sys.argv[1] if len(sys.argv) > 1 else "ste100.pickle"
+    examples = list(iter_examples(corpus_filename))
+    unusual = DependencyTree("tab\there", features={"dependency_label": "ROOT", "lemma": "line\nbreak",
+                                                     "misc": "SpaceAfter=No", "feats": "back\\slash"})
+    unusual.append(DependencyTree("missing"))
+    unusual.append(DependencyTree("empty", features={"dependency_label": "", "upos": "\r"}))
+    examples.append(("unusual values", unusual))
+    conllu_text = "".join(format_conllu(sentence, deptree) for sentence, deptree in examples)
+    read_back = list(iter_conllu_lines(io.StringIO(conllu_text)))
+    assert len(read_back) == len(examples)
+
+    def same_tree(tree, other):
+        # DependencyTree equality ignores features, so they are compared node by node
+        return tree == other and all(node.features == other_node.features
+                                     for node, other_node in zip(tree.subtrees(), other.subtrees()))
+
+    mismatches = [sentence for (sentence, deptree), (_, read_tree) in zip(examples, read_back)
+                  if not same_tree(deptree, read_tree)]
+    for sentence in mismatches:
+        print("changed by the round trip: {}".format(sentence.strip()))
+    print("{} of {} trees identical after a CoNLL-U round trip".format(len(examples) - len(mismatches), len(examples)))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,328 @@
+import mmap
+import pickle
+import struct
+import sys
+from array import array
+
+from compact_deptree import CompactDependencyTree, NO_ID, Vocabulary, node_features
+from deptree import DependencyTree
+
+CORPUS_MAGIC = b"CNLCRPS\0"
+
+CORPUS_VERSION = 1
+
+# magic, version, sentence count, string count, sentence index offset, string table offset
+_HEADER = struct.Struct("<8sIxxxxQQQQ")
+
+_COUNT = struct.Struct("<I")
+
+
+def iter_pickled_examples(corpus_filename):
+    """
+    Streams (sentence, DependencyTree) examples from a pickled corpus.
+
+    Handles both a single pickled list of examples, as written by load_from_spacy.load_examples,
+    and a file holding a sequence of pickled examples appended one after another, as written by
+    load_from_spacy.iter_parsed_examples.
+
+    :param corpus_filename: path to the pickled corpus
+    :type corpus_filename: str
+    :return: generator over (sentence, DependencyTree) pairs
+    """
+    with open(corpus_filename, 'rb') as corpus_file:
+        while True:
+            try:
+                loaded = pickle.load(corpus_file)
+            except EOFError:
+                return
+            if isinstance(loaded, list):
+                yield from loaded
+            else:
+                yield loaded
+
+
+def iter_examples(corpus_filename):
+    """
+    Streams (sentence, DependencyTree) examples from a binary or pickled corpus.
+
+    :param corpus_filename: path to the corpus
+    :type corpus_filename: str
+    :return: generator over (sentence, DependencyTree) pairs
+    """
+    with open(corpus_filename, 'rb') as corpus_file:
+        is_binary = corpus_file.read(len(CORPUS_MAGIC)) == CORPUS_MAGIC
+    if is_binary:
+        with CorpusReader(corpus_filename) as reader:
+            yield from reader
+    else:
+        yield from iter_pickled_examples(corpus_filename)
+
+
+def _to_little_endian(values):
+    if sys.byteorder != "little":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values
+
+
+def _from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+class CorpusWriter(object):
+    def __init__(self, corpus_filename):
+        """
+        Writes (sentence, DependencyTree) examples to a binary corpus file.
+
+        The file holds a header, one record per sentence with the tree as flat node arrays,
+        an index of record offsets and an interned string table:
+
+        - header: magic, format version, sentence count, string count and the offsets of the
+          index and string table, all little-endian
+        - record: sentence length and UTF-8 text, node count, then the head, label id and
+          dependency_label id arrays of a CompactDependencyTree as int32, then a count and
+          (node, feature id, value id) int32 triples holding all the features, in order, of the nodes
+          with features other than dependency_label
+        - index: uint64 offset of each record
+        - string table: uint64 offsets of the string count + 1 boundaries, then the UTF-8 data
+
+        :param corpus_filename: path of the corpus to create
+        :type corpus_filename: str
+        """
+        self._file = open(corpus_filename, 'wb')
+        self._file.write(bytes(_HEADER.size))
+        self._offsets = array('Q')
+        self.vocabulary = Vocabulary()
+
+    def write(self, sentence, deptree):
+        """
+        :param sentence: the text of the example
+        :type sentence: str
+        :param deptree: its tree
+        :type deptree: DependencyTree or CompactDependencyTree
+        """
+        if isinstance(deptree, CompactDependencyTree):
+            if deptree.vocabulary is not self.vocabulary:
+                deptree = CompactDependencyTree.from_deptree(deptree.to_deptree(), self.vocabulary)
+        else:
+            deptree = CompactDependencyTree.from_deptree(deptree, self.vocabulary)
+        text = sentence.encode('utf-8')
+        extra = array('i')
+        for index, features in sorted((deptree.extra_features or {}).items()):
+            for feature, value in features.items():
+                if not isinstance(value, str):
+                    raise ValueError("Only string feature values can be stored, got {!r} for {}".format(value, feature))
+                extra.extend((index, self.vocabulary.intern(feature), self.vocabulary.intern(value)))
+        # Only recorded once nothing can fail, so a rejected example leaves no record behind
+        self._offsets.append(self._file.tell())
+        self._file.write(_COUNT.pack(len(text)))
+        self._file.write(text)
+        self._file.write(_COUNT.pack(len(deptree)))
+        for values in deptree.heads, deptree.labels, deptree.dependency_labels:
+            self._file.write(_to_little_endian(values).tobytes())
+        self._file.write(_COUNT.pack(len(extra) // 3))
+        self._file.write(_to_little_endian(extra).tobytes())
+
+    def close(self):
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(_to_little_endian(self._offsets).tobytes())
+        strings_offset = self._file.tell()
+        encoded_strings = [string.encode('utf-8') for string in self.vocabulary.strings]
+        string_offsets = array('Q', [0])
+        for encoded in encoded_strings:
+            string_offsets.append(string_offsets[-1] + len(encoded))
+        self._file.write(_to_little_endian(string_offsets).tobytes())
+        self._file.write(b"".join(encoded_strings))
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, len(self._offsets), len(self.vocabulary),
+                                      index_offset, strings_offset))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class CorpusReader(object):
+    def __init__(self, corpus_filename):
+        """
+        Memory-maps a binary corpus written by CorpusWriter.
+
+        Opening a corpus only reads its header; sentences and strings are decoded when they
+        are accessed, so random access to sentence i does not touch the rest of the file.
+
+        :param corpus_filename: path to the corpus
+        :type corpus_filename: str
+        """
+        self._file = open(corpus_filename, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._sentence_count, self._string_count, self._index_offset, self._strings_offset = \
+            _HEADER.unpack_from(self._map)
+        if magic != CORPUS_MAGIC:
+            raise ValueError("{} is not a binary corpus".format(corpus_filename))
+        if version != CORPUS_VERSION:
+            raise ValueError("{} has corpus format version {}, expected {}".format(corpus_filename, version,
+                                                                                   CORPUS_VERSION))
+        self._string_data_offset = self._strings_offset + 8 * (self._string_count + 1)
+        self._strings = {}
+        self._vocabulary = None
+
+    def _record_offset(self, position):
+        return struct.unpack_from("<Q", self._map, self._index_offset + 8 * position)[0]
+
+    def string(self, string_id):
+        """
+        :param string_id: id in the corpus string table
+        :type string_id: int
+        :rtype: str
+        """
+        string = self._strings.get(string_id)
+        if string is None:
+            start, end = struct.unpack_from("<QQ", self._map, self._strings_offset + 8 * string_id)
+            string = self._map[self._string_data_offset + start:self._string_data_offset + end].decode('utf-8')
+            self._strings[string_id] = string
+        return string
+
+    @property
+    def vocabulary(self):
+        """
+        The whole string table as a Vocabulary, decoded the first time it is needed.
+        """
+        if self._vocabulary is None:
+            self._vocabulary = Vocabulary([self.string(string_id) for string_id in range(self._string_count)])
+        return self._vocabulary
+
+    def _read_record(self, position):
+        if not -self._sentence_count <= position < self._sentence_count:
+            raise IndexError("corpus index out of range")
+        offset = self._record_offset(position % self._sentence_count)
+        text_length = _COUNT.unpack_from(self._map, offset)[0]
+        offset += _COUNT.size
+        sentence = self._map[offset:offset + text_length].decode('utf-8')
+        offset += text_length
+        node_count = _COUNT.unpack_from(self._map, offset)[0]
+        offset += _COUNT.size
+        arrays = []
+        for _ in range(3):
+            arrays.append(_from_little_endian('i', self._map[offset:offset + 4 * node_count]))
+            offset += 4 * node_count
+        extra_count = _COUNT.unpack_from(self._map, offset)[0]
+        offset += _COUNT.size
+        extra = _from_little_endian('i', self._map[offset:offset + 12 * extra_count])
+        return sentence, arrays, extra
+
+    def compact(self, position):
+        """
+        :param position: index of the example
+        :type position: int
+        :return: the sentence and its tree, using the corpus vocabulary
+        :rtype: (str, CompactDependencyTree)
+        """
+        sentence, (heads, labels, dependency_labels), extra = self._read_record(position)
+        extra_features = None
+        if extra:
+            extra_features = {}
+            for start in range(0, len(extra), 3):
+                index, feature, value = extra[start:start + 3]
+                extra_features.setdefault(index, {})[self.string(feature)] = self.string(value)
+        return sentence, CompactDependencyTree(self.vocabulary, heads, labels, dependency_labels, extra_features)
+
+    def __getitem__(self, position):
+        """
+        :param position: index of the example
+        :type position: int
+        :return: the sentence and its tree
+        :rtype: (str, DependencyTree)
+        """
+        sentence, (heads, labels, dependency_labels), extra = self._read_record(position)
+        extra_features = {}
+        for start in range(0, len(extra), 3):
+            index, feature, value = extra[start:start + 3]
+            extra_features.setdefault(index, {})[self.string(feature)] = self.string(value)
+        nodes = []
+        for index, head in enumerate(heads):
+            dependency_label = self.string(dependency_labels[index]) if dependency_labels[index] != NO_ID else None
+            node = DependencyTree(self.string(labels[index]),
+                                  features=node_features(dependency_label, extra_features.get(index)))
+            nodes.append(node)
+            if head != NO_ID:
+                nodes[head].append(node)
+        return sentence, nodes[0]
+
+    def __len__(self):
+        return self._sentence_count
+
+    def __iter__(self):
+        for position in range(self._sentence_count):
+            yield self[position]
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_corpus(corpus_filename, examples):
+    """
+    :param corpus_filename: path of the binary corpus to create
+    :type corpus_filename: str
+    :param examples: (sentence, DependencyTree) pairs
+    :type examples: iterable
+    """
+    with CorpusWriter(corpus_filename) as writer:
+        for sentence, deptree in examples:
+            writer.write(sentence, deptree)
+
+
+def _same_example(example, read_example):
+    # DependencyTree equality ignores features, so they are compared node by node, order included
+    (sentence, deptree), (read_sentence, read_deptree) = example, read_example
+    return sentence == read_sentence and deptree == read_deptree and \
+        [list(node.features.items()) for node in deptree.subtrees()] == \
+        [list(node.features.items()) for node in read_deptree.subtrees()]
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Check that a corpus survives a round trip through the binary format.")
+    parser.add_argument("corpus", nargs="?", default="ste100.pickle", help="pickled (sentence, DependencyTree) examples")
+    args = parser.parse_args()
+
+    examples = list(iter_pickled_examples(args.corpus))
+    with tempfile.TemporaryDirectory() as corpus_directory:
+        corpus_path = os.path.join(corpus_directory, "check.corpus")
+        write_corpus(corpus_path, examples)
+        with CorpusReader(corpus_path) as reader:
+            identical = sum(map(_same_example, examples, reader)) if len(reader) == len(examples) else 0
+
+        # An example the writer rejects must not leave a record behind
+        with CorpusWriter(corpus_path) as writer:
+            for sentence, value in ("a", "x"), ("b", 1), ("c", "z"):
+                try:
+                    writer.write(sentence, DependencyTree(sentence, features={"dependency_label": "ROOT",
+                                                                              "value": value}))
+                except ValueError:
+                    pass
+        with CorpusReader(corpus_path) as reader:
+            after_rejection = [sentence for sentence, _ in reader]
+
+    print("{} of {} examples identical after a binary corpus round trip".format(identical, len(examples)))
+    print("After writing a, rejecting b and writing c, the corpus holds {}".format(after_rejection))
+    if identical != len(examples) or after_rejection != ["a", "c"]:
+        sys.exit(1)
@@ -1,5 +1,6 @@
 from nltk import Tree
-from nltk.compat import string_types
+
+from tree_format import pformat_flat, pformat_tree
 
 
 class DependencyTree(Tree):
@@ -51,52 +52,7 @@ class DependencyTree(Tree):
         :return: A pretty-printed string representation of this tree.
         :rtype: basestring
         """
-
-        # Try writing it on one line.
-        s = self._pformat_flat(nodesep, parens, quotes, with_features)
-        if len(s) + indent < margin:
-            return s
-
-        # If it doesn't fit on one line, then write it on multi-lines.
-        if isinstance(self._label, string_types):
-            output_label = self._label
-            if with_features:
-                for feature in self.features:
-                    output_label += ":{}={}".format(feature, self.features[feature])
-            s = '%s%s%s' % (parens[0], output_label, nodesep)
-        else:
-            s = '%s%s%s' % (parens[0], str(self._label), nodesep)
-        for child in self:
-            if isinstance(child, DependencyTree):
-                s += '\n' + ' ' * (indent + 2) + child.pformat(margin, indent + 2, nodesep, parens, quotes, with_features)
-            elif isinstance(child, tuple):
-                s += '\n' + ' ' * (indent + 2) + "/".join(child)
-            elif isinstance(child, string_types) and not quotes:
-                s += '\n' + ' ' * (indent + 2) + '%s' % child
-            else:
-                s += '\n' + ' ' * (indent + 2) + str(child)
-        return s + parens[1]
+        return pformat_tree(self, margin, indent, nodesep, parens, quotes, with_features, tree_type=DependencyTree)
 
     def _pformat_flat(self, nodesep, parens, quotes, with_features=True):
-        child_strings = []
-        for child in self:
-            if isinstance(child, DependencyTree):
-                child_strings.append(child._pformat_flat(nodesep, parens, quotes, with_features))
-            elif isinstance(child, tuple):
-                child_strings.append("/".join(child))
-            elif isinstance(child, string_types) and not quotes:
-                child_strings.append('%s' % child)
-            else:
-                child_strings.append(str(child))
-        if isinstance(self._label, string_types):
-            if with_features:
-                output_label = self._label
-                for feature in self.features:
-                    output_label += ":{}={}".format(feature, self.features[feature])
-            else:
-                output_label = self._label
-            return '%s%s%s %s%s' % (parens[0], output_label, nodesep,
-                                    " ".join(child_strings), parens[1])
-        else:
-            return '%s%s%s %s%s' % (parens[0], str(self._label), nodesep,
-                                    " ".join(child_strings), parens[1])
+        return pformat_flat(self, nodesep, parens, quotes, with_features, tree_type=DependencyTree)
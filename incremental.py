@@ -0,0 +1,225 @@
+import time
+
+import profiling
+import ste_realization
+
+
+class IncrementalRealizer(object):
+    def __init__(self, deptree, with_stemming=True):
+        """
+        Realizes a DependencyTree which is edited in place, re-realizing only what an edit touched.
+
+        The realized fragment of every subtree is kept. An edit marks the edited node and its
+        ancestors dirty, and the next call to realize rebuilds just those fragments from the
+        fragments of their clean children. The Python work after an edit is therefore proportional
+        to the depth of the edited node and the number of children along the way, not to the size
+        of the tree; the one cost which grows with the tree is joining each ancestor's fragment
+        string, a copy done in C.
+
+        Edits should go through the methods of this class. Code which changes the tree directly
+        must call mark_dirty on each node it changed.
+
+        :param deptree: the tree to realize; it is edited in place
+        :type deptree: DependencyTree
+        :param with_stemming: whether to stem node labels
+        :type with_stemming: bool
+        """
+        self.deptree = deptree
+        self.with_stemming = with_stemming
+        self._parents = {}
+        self._fragments = {}
+        self._dirty = set()
+        self._rules_fingerprint = None
+        self._register(deptree, None)
+
+    def _register(self, deptree, parent):
+        self._parents[id(deptree)] = parent
+        stack = [deptree]
+        while stack:
+            node = stack.pop()
+            self._dirty.add(id(node))
+            for child in node:
+                self._parents[id(child)] = node
+                stack.append(child)
+
+    def _forget(self, deptree):
+        stack = [deptree]
+        while stack:
+            node = stack.pop()
+            self._parents.pop(id(node), None)
+            self._fragments.pop(id(node), None)
+            self._dirty.discard(id(node))
+            stack.extend(node)
+
+    def mark_dirty(self, node):
+        """
+        Marks a node and its ancestors for re-realization.
+
+        :param node: a node of the tree whose label, features or children have changed
+        :type node: DependencyTree
+        """
+        while node is not None and id(node) not in self._dirty:
+            self._dirty.add(id(node))
+            node = self._parents[id(node)]
+
+    def set_label(self, node, label):
+        node.set_label(label)
+        self.mark_dirty(node)
+
+    def set_feature(self, node, name, value):
+        """
+        :param node: the node to change
+        :type node: DependencyTree
+        :param name: the feature, e.g. ``dependency_label``
+        :type name: str
+        :param value: its new value, or None to remove the feature
+        """
+        if value is None:
+            node.features.pop(name, None)
+        else:
+            node.features[name] = value
+        self.mark_dirty(node)
+
+    def insert_child(self, parent, child, position=None):
+        """
+        :param parent: the node to attach the child to
+        :type parent: DependencyTree
+        :param child: the new child, which may have children of its own
+        :type child: DependencyTree
+        :param position: index among the parent's children; defaults to the end
+        :type position: int
+        """
+        if id(child) in self._parents:
+            raise ValueError("{} is already in the tree".format(child.label()))
+        if position is None:
+            parent.append(child)
+        else:
+            parent.insert(position, child)
+        self._register(child, parent)
+        self.mark_dirty(parent)
+
+    def remove_child(self, child):
+        """
+        :param child: the node to detach, with its subtree
+        :type child: DependencyTree
+        :return: the detached child
+        :rtype: DependencyTree
+        """
+        parent = self._parents.get(id(child))
+        if parent is None:
+            raise ValueError("cannot remove the root of the tree")
+        # Found by identity, as trees with the same labels compare equal
+        del parent[next(position for position, sibling in enumerate(parent) if sibling is child)]
+        self._forget(child)
+        self.mark_dirty(parent)
+        return child
+
+    def realize(self):
+        """
+        :return: the realization of the whole tree, as ste_realization.realize would produce it
+        :rtype: str
+        """
+        start_time = profiling.timer() if profiling.enabled else None
+        rules = ste_realization.linearization_rules
+        if rules.fingerprint != self._rules_fingerprint:
+            # The word order changed under us, so no fragment can be trusted
+            self._fragments.clear()
+            self._register(self.deptree, None)
+            self._rules_fingerprint = rules.fingerprint
+        dirty = self._dirty
+        if dirty:
+            fragments = self._fragments
+            realized_count = 0
+            # Post-order over the dirty nodes only; every ancestor of a dirty node is dirty, so all are reached
+            stack = [(self.deptree, False)]
+            while stack:
+                node, children_done = stack.pop()
+                if children_done:
+                    fragments[id(node)] = self._realize_node(node, rules)
+                    realized_count += 1
+                else:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node if id(child) in dirty)
+            dirty.clear()
+            if start_time is not None:
+                profiling.count("incremental", "nodes_realized", realized_count)
+        if start_time is not None:
+            profiling.record("incremental.realize", start_time)
+        return self._fragments[id(self.deptree)]
+
+    def fragment(self, node):
+        """
+        :param node: a node of the tree
+        :type node: DependencyTree
+        :return: the realization of the node's subtree as of the last call to realize
+        :rtype: str
+        """
+        return self._fragments[id(node)]
+
+    def _realize_node(self, node, rules):
+        if self.with_stemming:
+            head = ste_realization.stemmer.stem(node.label())
+        else:
+            head = node.label()
+        if not node:
+            return head
+        phrase_rules = rules.phrase_for(node.features.get("dependency_label"))
+        buffers = [None] * len(phrase_rules.slots)
+        for child in node:
+            slot = phrase_rules.slot(child.label(), child.features.get("dependency_label"))
+            if buffers[slot] is None:
+                buffers[slot] = [child]
+            else:
+                buffers[slot].append(child)
+        fragments = self._fragments
+        parts = []
+        for slot, buffer in enumerate(buffers):
+            if slot == phrase_rules.head_slot:
+                parts.append(head)
+            elif buffer is not None:
+                parts.extend(fragments[id(child)] for child in buffer)
+        return " ".join(parts)
+
+
+if __name__ == "__main__":
+    import random
+    from deptree import DependencyTree
+
+    random_state = random.Random(0)
+    words = ["valve", "pump", "filter", "open", "close", "the", "clean", "dry", "slowly"]
+    labels = ["nsubj", "dobj", "det", "amod", "prep", "pobj", "advmod", "conj", "cc", "compound", "aux", "punct"]
+    for node_count in (1000, 10000, 100000):
+        # Each node hangs off a random earlier one, which keeps the depth logarithmic as in real procedures
+        nodes = [DependencyTree("do", features={"dependency_label": "ROOT"})]
+        for _ in range(node_count - 1):
+            node = DependencyTree(random_state.choice(words),
+                                  features={"dependency_label": random_state.choice(labels)})
+            random_state.choice(nodes).append(node)
+            nodes.append(node)
+        deptree = nodes[0]
+        realizer = IncrementalRealizer(deptree, with_stemming=False)
+        start_time = time.time()
+        realizer.realize()
+        initial_time = time.time() - start_time
+
+        leaves = []
+        stack = [deptree]
+        while stack:
+            node = stack.pop()
+            if not node:
+                leaves.append(node)
+            stack.extend(node)
+        edits = 200
+        start_time = time.time()
+        for edit in range(edits):
+            leaf = random_state.choice(leaves)
+            realizer.set_label(leaf, random_state.choice(words))
+            realization = realizer.realize()
+        incremental_time = (time.time() - start_time) / edits
+        start_time = time.time()
+        full_realization = ste_realization.realize(deptree, with_stemming=False)
+        full_time = time.time() - start_time
+        assert realization == full_realization
+        print("{} nodes: first realization {:.2f} ms, full re-realization {:.2f} ms, "
+              "incremental re-realization after one edit {:.3f} ms".format(
+                  node_count, 1000 * initial_time, 1000 * full_time, 1000 * incremental_time))
@@ -0,0 +1,148 @@
+import importlib
+import marshal
+import os
+import string
+import sys
+
+LEXICON_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+CACHE_FILENAME = "lexicon.cache"
+
+CACHE_VERSION = 1
+
+
+def lexicon_module_names(directory=LEXICON_DIRECTORY):
+    """
+    :param directory: where to look for LETTER.py lexicon files
+    :type directory: str
+    :return: the names of the lexicon modules present, in alphabetical order
+    :rtype: list
+    """
+    return [letter for letter in string.ascii_lowercase
+            if os.path.exists(os.path.join(directory, letter + ".py"))]
+
+
+def load_entries(module_names, directory=LEXICON_DIRECTORY):
+    """
+    :param module_names: lexicon modules to import, each defining lexicon_LETTER
+    :type module_names: list
+    :param directory: where the lexicon modules live
+    :type directory: str
+    :return: all (word, pos) entries in file order
+    :rtype: list
+    """
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    entries = []
+    for module_name in module_names:
+        entries.extend(getattr(importlib.import_module(module_name), "lexicon_" + module_name))
+    return entries
+
+
+class Lexicon(object):
+    def __init__(self, entries):
+        """
+        Hash index over the STE vocabulary, keyed by word and by (word, pos).
+
+        Multi-word entries such as "adjacent to" are indexed under the whole phrase.
+
+        :param entries: (word, pos) tuples
+        :type entries: iterable
+        """
+        self.entries = []
+        self.pos_by_word = {}
+        for word, pos in entries:
+            if pos not in self.pos_by_word.setdefault(word, ()):
+                self.entries.append((word, pos))
+                self.pos_by_word[word] += (pos, )
+        self.word_pos = frozenset(self.entries)
+
+    @classmethod
+    def load(cls, directory=LEXICON_DIRECTORY, cache_filename=CACHE_FILENAME):
+        """
+        Loads every LETTER.py lexicon file in a directory, going through a marshalled cache
+        which is rebuilt whenever one of the lexicon files changes.
+
+        :param directory: where the lexicon modules live
+        :type directory: str
+        :param cache_filename: name of the cache file inside the directory, or None to skip caching
+        :type cache_filename: str
+        :rtype: Lexicon
+        """
+        module_names = lexicon_module_names(directory)
+        sources = {}
+        for module_name in module_names:
+            source_stat = os.stat(os.path.join(directory, module_name + ".py"))
+            sources[module_name] = (source_stat.st_mtime_ns, source_stat.st_size)
+        cache_path = os.path.join(directory, cache_filename) if cache_filename else None
+        if cache_path:
+            try:
+                with open(cache_path, 'rb') as cache_file:
+                    cached = marshal.load(cache_file)
+                if cached["version"] == CACHE_VERSION and cached["sources"] == sources:
+                    return cls._from_index(cached["entries"], cached["pos_by_word"])
+            except (OSError, EOFError, ValueError, TypeError, KeyError):
+                pass
+        lexicon = cls(load_entries(module_names, directory))
+        if cache_path:
+            try:
+                with open(cache_path, 'wb') as cache_file:
+                    marshal.dump({"version": CACHE_VERSION, "sources": sources,
+                                  "entries": lexicon.entries, "pos_by_word": lexicon.pos_by_word}, cache_file)
+            except OSError:
+                pass
+        return lexicon
+
+    @classmethod
+    def _from_index(cls, entries, pos_by_word):
+        lexicon = cls.__new__(cls)
+        lexicon.entries = entries
+        lexicon.pos_by_word = pos_by_word
+        lexicon.word_pos = frozenset(entries)
+        return lexicon
+
+    def is_approved(self, word, pos=None):
+        """
+        :param word: a word or multi-word term, matched case-insensitively
+        :type word: str
+        :param pos: if given, the word must be approved with this part of speech
+        :type pos: str
+        :rtype: bool
+        """
+        word = word.lower()
+        if pos is None:
+            return word in self.pos_by_word
+        return (word, pos) in self.word_pos
+
+    def pos_tags(self, word):
+        """
+        :return: the parts of speech the word is approved with, in lexicon order
+        :rtype: tuple
+        """
+        return self.pos_by_word.get(word.lower(), ())
+
+    def words(self):
+        return self.pos_by_word.keys()
+
+    def __contains__(self, word):
+        return self.is_approved(word)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+_lexicon = None
+
+
+def get_lexicon():
+    """
+    :return: the shared Lexicon for the STE dictionary files, loaded on first use
+    :rtype: Lexicon
+    """
+    global _lexicon
+    if _lexicon is None:
+        _lexicon = Lexicon.load()
+    return _lexicon
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import pickle
+import time
+
+RULES_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "linearization_rules.tsv")
+
+HEAD_SLOT = "head"
+
+# Phrase type realize_noun_phrase places children by, when the rules define it
+NOUN_PHRASE = "noun_phrase"
+
+
+class PhraseRules(object):
+    __slots__ = ("name", "slots", "head_slot", "by_dependency", "by_word", "default_slot", "push_order")
+
+    def __init__(self, name, slots, by_dependency, by_word, default_slot):
+        """
+        Compiled placement rules for one phrase type, mapping each child of a node to the index
+        of the slot it is realized in.
+
+        :param name: the phrase type, e.g. ``clause``
+        :type name: str
+        :param slots: slot names from left to right, including ``head``
+        :type slots: tuple
+        :param by_dependency: slot index for children with each dependency label
+        :type by_dependency: dict
+        :param by_word: slot index for children with each label, checked before their dependency label
+        :type by_word: dict
+        :param default_slot: slot index for all other children
+        :type default_slot: int
+        """
+        self.name = name
+        self.slots = slots
+        self.head_slot = slots.index(HEAD_SLOT)
+        self.by_dependency = by_dependency
+        self.by_word = by_word
+        self.default_slot = default_slot
+        # Slot indices from right to left, with None for the head, for pushing a phrase onto a stack
+        self.push_order = tuple(None if slot == self.head_slot else slot for slot in range(len(slots) - 1, -1, -1))
+
+    def slot(self, label, dep):
+        """
+        :param label: the child's label
+        :type label: str
+        :param dep: the child's dependency label
+        :type dep: str
+        :return: index of the slot the child goes in
+        :rtype: int
+        """
+        if self.by_word:
+            slot = self.by_word.get(label)
+            if slot is not None:
+                return slot
+        return self.by_dependency.get(dep, self.default_slot)
+
+
+class LinearizationRules(object):
+    def __init__(self, phrases, phrase_by_dependency):
+        """
+        :param phrases: the phrase types in file order; the first is used for unlisted dependency labels
+        :type phrases: list
+        :param phrase_by_dependency: PhraseRules to realize nodes with each dependency label as
+        :type phrase_by_dependency: dict
+        """
+        self.phrases = {phrase.name: phrase for phrase in phrases}
+        self.default_phrase = phrases[0]
+        self.phrase_by_dependency = phrase_by_dependency
+        # Identifies the rules in cache keys, so realizations made under other rules are not reused
+        state = [(phrase.name, phrase.slots, sorted(phrase.by_dependency.items()), sorted(phrase.by_word.items()),
+                  phrase.default_slot) for phrase in phrases]
+        state.append(sorted((dep, phrase.name) for dep, phrase in phrase_by_dependency.items()))
+        self.fingerprint = hashlib.blake2b(pickle.dumps(state, protocol=2), digest_size=8).digest()
+
+    def phrase_for(self, dep):
+        """
+        :param dep: a node's dependency label
+        :type dep: str
+        :return: the rules its children are placed by
+        :rtype: PhraseRules
+        """
+        return self.phrase_by_dependency.get(dep, self.default_phrase)
+
+
+def parse_rules(lines, source="<rules>"):
+    """
+    Compiles linearization rules from lines in the format of linearization_rules.tsv.
+
+    :param lines: the rule lines, e.g. an open file
+    :type lines: iterable
+    :param source: name of the rules for error messages
+    :type source: str
+    :return: the compiled rules
+    :rtype: LinearizationRules
+    :raises ValueError: if a rule is malformed or contradicts another
+    """
+    orders = {}
+    placements = []
+    defaults = {}
+    phrase_dependencies = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        fields = [field.strip() for field in line.split("\t")]
+        kind = fields[0]
+
+        def error(message):
+            return ValueError("{}, line {}: {}".format(source, line_number, message))
+
+        if kind == "order":
+            if len(fields) < 3 or HEAD_SLOT not in fields[2:]:
+                raise error("order needs a phrase type and slots including '{}'".format(HEAD_SLOT))
+            if len(set(fields[2:])) != len(fields[2:]):
+                raise error("order repeats a slot")
+            orders[fields[1]] = (tuple(fields[2:]), line_number)
+        elif kind == "phrase":
+            if len(fields) < 3:
+                raise error("phrase needs a phrase type and dependency labels")
+            phrase_dependencies.extend((fields[1], dep, line_number) for dep in fields[2:])
+        elif kind in ("dep", "word"):
+            if len(fields) < 4:
+                raise error("{} needs a phrase type, a slot and at least one {}".format(
+                    kind, "dependency label" if kind == "dep" else "word"))
+            placements.extend((kind, fields[1], fields[2], trigger, line_number) for trigger in fields[3:])
+        elif kind == "default":
+            if len(fields) != 3:
+                raise error("default needs a phrase type and a slot")
+            defaults[fields[1]] = (fields[2], line_number)
+        else:
+            raise error("unknown rule kind '{}'".format(kind))
+
+    if not orders:
+        raise ValueError("{}: no order rules".format(source))
+    tables = {name: ({}, {}) for name in orders}
+    for kind, name, slot, trigger, line_number in placements:
+        if name not in orders:
+            raise ValueError("{}, line {}: unknown phrase type '{}'".format(source, line_number, name))
+        slots = orders[name][0]
+        if slot not in slots or slot == HEAD_SLOT:
+            raise ValueError("{}, line {}: '{}' is not a slot of {}".format(source, line_number, slot, name))
+        table = tables[name][0 if kind == "dep" else 1]
+        if table.get(trigger, slots.index(slot)) != slots.index(slot):
+            raise ValueError("{}, line {}: {} '{}' is already placed in {}".format(
+                source, line_number, kind, trigger, slots[table[trigger]]))
+        table[trigger] = slots.index(slot)
+
+    phrases = []
+    for name, (slots, line_number) in sorted(orders.items(), key=lambda item: item[1][1]):
+        if name not in defaults:
+            raise ValueError("{}: phrase type {} has no default rule".format(source, name))
+        default_slot, default_line_number = defaults[name]
+        if default_slot not in slots or default_slot == HEAD_SLOT:
+            raise ValueError("{}, line {}: '{}' is not a slot of {}".format(
+                source, default_line_number, default_slot, name))
+        by_dependency, by_word = tables[name]
+        phrases.append(PhraseRules(name, slots, by_dependency, by_word, slots.index(default_slot)))
+
+    phrases_by_name = {phrase.name: phrase for phrase in phrases}
+    phrase_by_dependency = {}
+    for name, dep, line_number in phrase_dependencies:
+        if name not in phrases_by_name:
+            raise ValueError("{}, line {}: unknown phrase type '{}'".format(source, line_number, name))
+        phrase_by_dependency[dep] = phrases_by_name[name]
+    return LinearizationRules(phrases, phrase_by_dependency)
+
+
+def load_rules(rules_filename=RULES_FILENAME):
+    """
+    :param rules_filename: path to a rules file; defaults to linearization_rules.tsv next to this module
+    :type rules_filename: str
+    :return: the compiled rules
+    :rtype: LinearizationRules
+    """
+    with open(rules_filename, 'r', encoding='utf-8') as rules_file:
+        return parse_rules(rules_file, rules_filename)
+
+
+if __name__ == "__main__":
+    # Compares the per-child dispatch of the compiled rules with the tuple membership tests they replaced
+    def legacy_attachment(label, dep):
+        if dep in ("det", "mark") or label in ("when", ):
+            return -3
+        elif dep in ("nsubj", "nsubjpass", "amod", "nummod"):
+            return -2
+        elif dep in ("aux", "auxpass", "neg", "compound"):
+            return -1
+        else:
+            return 1
+
+    with open("ste100.pickle", 'rb') as ste_pickle:
+        trees = [example[1] for example in pickle.load(ste_pickle)]
+    children = []
+    stack = list(trees)
+    while stack:
+        node = stack.pop()
+        children.extend((child.label(), child.features.get("dependency_label")) for child in node)
+        stack.extend(node)
+    children *= 2000
+
+    clause = load_rules().phrases["clause"]
+    assert all(clause.slot(label, dep) - clause.head_slot == legacy_attachment(label, dep)
+               for label, dep in children[:10000])
+    start_time = time.time()
+    for label, dep in children:
+        legacy_attachment(label, dep)
+    legacy_time = time.time() - start_time
+    by_word_get = clause.by_word.get
+    by_dependency_get = clause.by_dependency.get
+    default_slot = clause.default_slot
+    start_time = time.time()
+    for label, dep in children:
+        slot = by_word_get(label)
+        if slot is None:
+            slot = by_dependency_get(dep, default_slot)
+    table_time = time.time() - start_time
+    print("Placing {} children: {:.3f} seconds with membership tests, {:.3f} seconds with the rule tables".format(
+        len(children), legacy_time, table_time))
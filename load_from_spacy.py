@@ -1,21 +1,50 @@
 import pickle
 import time
+from array import array
 
+import profiling
+from compact_deptree import NO_ID, CompactDependencyTree, shared_vocabulary
+from corpus import write_corpus
 from deptree import DependencyTree
 
-print("Loading spaCy for English...")
-start_time = time.time()
+# Pipeline components from_spacy_sentence has no use for
+PARSER_ONLY_DISABLED = ("ner", )
 
-import spacy
-en_nlp = spacy.load('en')
+DEFAULT_BATCH_SIZE = 1000
 
-print("Loaded in {} seconds.".format(time.time() - start_time))
+_en_nlp_models = {}
+
+
+def get_en_nlp(parser_only=False):
+    """
+    Returns the shared spaCy English model, loading it on first use.
+
+    :param parser_only: load only the components from_spacy_sentence needs (tagger and parser)
+    :type parser_only: bool
+    :return: the spaCy language object
+    :rtype: spacy.language.Language
+    """
+    if False in _en_nlp_models:
+        # The full pipeline serves parser-only callers too
+        return _en_nlp_models[False]
+    if parser_only not in _en_nlp_models:
+        print("Loading spaCy for English...")
+        start_time = time.time()
+        import spacy
+        if parser_only:
+            _en_nlp_models[parser_only] = spacy.load('en', disable=list(PARSER_ONLY_DISABLED))
+        else:
+            _en_nlp_models[parser_only] = spacy.load('en')
+        print("Loaded in {} seconds.".format(time.time() - start_time))
+    return _en_nlp_models[parser_only]
 
 
 def from_spacy_sentence(spacy_doc, find_root=True):
     """
     Produces a DependencyTree object from a spaCy doc.
 
+    The parse is walked with an explicit stack, so sentences of any depth can be converted.
+
     :param spacy_doc:
     :type spacy_doc: spacy.tokens.doc.Doc
     :param find_root:
@@ -23,18 +52,136 @@ def from_spacy_sentence(spacy_doc, find_root=True):
     :return: a DependencyTree extracted from the doc
     :rtype: deptree.DependencyTree
     """
+    start_time = profiling.timer() if profiling.enabled and find_root else None
     if find_root:
         root = get_root(spacy_doc)
     else:
         root = spacy_doc
-    dt = DependencyTree(str(root))
-    dt.features['dependency_label'] = en_nlp.vocab[root.dep].orth_
-    for child in root.children:
-        child_tree = from_spacy_sentence(child, find_root=False)
-        dt.append(child_tree)
+    dt = _spacy_node(root)
+    stack = [(root, dt)]
+    while stack:
+        token, tree = stack.pop()
+        for child in token.children:
+            child_tree = _spacy_node(child)
+            tree.append(child_tree)
+            stack.append((child, child_tree))
+    if start_time is not None:
+        profiling.record("from_spacy_sentence", start_time)
     return dt
 
 
+def _spacy_node(token):
+    if profiling.enabled:
+        profiling.count("spacy_dependency_label", token.dep_)
+    return DependencyTree(str(token), features={'dependency_label': token.dep_})
+
+
+def from_spacy_doc(spacy_doc, compact=False, vocabulary=None):
+    """
+    Produces one tree per sentence of a parsed spaCy doc.
+
+    The words, heads and dependency labels are read in bulk with ``Doc.to_array`` and each
+    sentence is built in one flat pass over them, without touching spaCy's Token objects.
+    Sentences are split where no dependency arc crosses between neighbouring tokens, which in
+    a parsed doc are exactly its sentence boundaries.
+
+    :param spacy_doc: a doc parsed by a pipeline with a dependency parser
+    :type spacy_doc: spacy.tokens.doc.Doc
+    :param compact: produce CompactDependencyTrees instead of DependencyTrees
+    :type compact: bool
+    :param vocabulary: the string table compact trees intern labels in; defaults to shared_vocabulary
+    :type vocabulary: compact_deptree.Vocabulary
+    :return: the trees of the doc's sentences, in order; each matches from_spacy_sentence on that sentence
+    :rtype: list
+    """
+    from spacy.attrs import DEP, HEAD, ORTH
+    start_time = profiling.timer() if profiling.enabled else None
+    if not len(spacy_doc):
+        return []
+    strings = spacy_doc.vocab.strings
+    # HEAD holds offsets from each token, which come back wrapped around as unsigned values
+    offsets = spacy_doc.to_array(HEAD).astype("int64").tolist()
+    word_hashes, dep_hashes = zip(*spacy_doc.to_array([ORTH, DEP]).tolist())
+    texts = {}
+    for string_hash in set(word_hashes).union(dep_hashes):
+        texts[string_hash] = strings[string_hash]
+    if start_time is not None:
+        for string_hash in dep_hashes:
+            profiling.count("spacy_dependency_label", texts[string_hash])
+    if compact:
+        # Compact trees hold vocabulary ids, so each distinct string is interned once per doc
+        if vocabulary is None:
+            vocabulary = shared_vocabulary
+        texts = {string_hash: vocabulary.intern(text) for string_hash, text in texts.items()}
+    words = [texts[string_hash] for string_hash in word_hashes]
+    deps = [texts[string_hash] for string_hash in dep_hashes]
+    heads = [index + offset for index, offset in enumerate(offsets)]
+
+    # The rightmost token each token is linked to by an arc starting at it or reaching back to it
+    right_ends = list(range(len(heads)))
+    for index, head in enumerate(heads):
+        if head > index:
+            if head > right_ends[index]:
+                right_ends[index] = head
+        elif index > right_ends[head]:
+            right_ends[head] = index
+    trees = []
+    sentence_start = 0
+    reach = 0
+    for index, right_end in enumerate(right_ends):
+        if right_end > reach:
+            reach = right_end
+        if reach <= index:
+            if compact:
+                trees.append(_compact_sentence(words, heads, deps, sentence_start, index + 1, vocabulary))
+            else:
+                trees.append(_sentence_tree(words, heads, deps, sentence_start, index + 1))
+            sentence_start = index + 1
+            reach = index + 1
+    if start_time is not None:
+        profiling.record("from_spacy_doc", start_time)
+    return trees
+
+
+def _sentence_tree(words, heads, deps, start, end):
+    nodes = [DependencyTree(words[index], features={'dependency_label': deps[index]}) for index in range(start, end)]
+    root = None
+    # Children are appended in token order, as Token.children yields them
+    for index in range(start, end):
+        head = heads[index]
+        if head == index:
+            root = nodes[index - start]
+        else:
+            nodes[head - start].append(nodes[index - start])
+    return root
+
+
+def _compact_sentence(label_ids, heads, dependency_label_ids, start, end, vocabulary):
+    children = [[] for _ in range(start, end)]
+    root = None
+    for index in range(start, end):
+        head = heads[index]
+        if head == index:
+            root = index - start
+        else:
+            children[head - start].append(index - start)
+    # CompactDependencyTree stores its nodes in pre-order
+    compact_heads = array('i')
+    labels = array('i')
+    dependency_labels = array('i')
+    positions = [NO_ID] * (end - start)
+    stack = [(root, NO_ID)]
+    while stack:
+        node, head = stack.pop()
+        positions[node] = len(compact_heads)
+        compact_heads.append(head)
+        labels.append(label_ids[start + node])
+        dependency_labels.append(dependency_label_ids[start + node])
+        position = positions[node]
+        stack.extend((child, position) for child in reversed(children[node]))
+    return CompactDependencyTree(vocabulary, compact_heads, labels, dependency_labels)
+
+
 def get_root(spacy_doc):
     """
 
@@ -42,9 +189,12 @@ def get_root(spacy_doc):
     :type spacy_doc: spacy.tokens.doc.Doc
     :return:
     """
+    start_time = profiling.timer() if profiling.enabled else None
     token = spacy_doc[0]
     while token.head is not token:
         token = token.head
+    if start_time is not None:
+        profiling.record("get_root", start_time)
     return token
 
 
@@ -53,17 +203,53 @@ def print_dependencies(spacy_doc, from_root=True):
         root = get_root(spacy_doc)
     else:
         root = spacy_doc
-    print(root.dep, root)
-    for child in root.children:
-        print_dependencies(child, from_root=False)
-
-
-def load_examples(example_filename):
-    examples = []
-    with open(example_filename, 'r') as example_file:
-        for line in example_file:
-            dt = from_spacy_sentence(en_nlp(line))
-            examples.append((line, dt))
-    with open(".".join(example_filename.split(".")[:-1]) + ".pickle", 'wb') as ste_pickle:
-        pickle.dump(examples, ste_pickle)
+    stack = [root]
+    while stack:
+        token = stack.pop()
+        print(token.dep, token)
+        stack.extend(reversed(list(token.children)))
+
+
+def iter_parsed_examples(example_filename, batch_size=DEFAULT_BATCH_SIZE, n_process=1, store_filename=None,
+                         parser_only=True):
+    """
+    Parses a file of sentences, one per line, yielding examples as they are parsed.
+
+    Lines are streamed through ``nlp.pipe`` in batches, so memory use does not grow with the
+    size of the input. If ``store_filename`` is given, each example is also appended to it as
+    a separate pickle, readable with corpus.iter_pickled_examples.
+
+    :param example_filename: path to the sentence file
+    :type example_filename: str
+    :param batch_size: number of lines spaCy parses per batch
+    :type batch_size: int
+    :param n_process: number of processes spaCy parses with
+    :type n_process: int
+    :param store_filename: path of the pickle store to append examples to
+    :type store_filename: str
+    :param parser_only: load only the spaCy components needed to build trees
+    :type parser_only: bool
+    :return: generator over (sentence, DependencyTree) pairs
+    """
+    en_nlp = get_en_nlp(parser_only)
+    store = open(store_filename, 'ab') if store_filename else None
+    try:
+        with open(example_filename, 'r') as example_file:
+            lines = ((line, line) for line in example_file)
+            docs = en_nlp.pipe(lines, as_tuples=True, batch_size=batch_size, n_process=n_process)
+            for example_count, (doc, line) in enumerate(docs, 1):
+                example = (line, from_spacy_doc(doc)[0])
+                if store:
+                    pickle.dump(example, store)
+                    if example_count % batch_size == 0:
+                        store.flush()
+                yield example
+    finally:
+        if store:
+            store.close()
+
+
+def load_examples(example_filename, parser_only=True):
+    examples = list(iter_parsed_examples(example_filename, parser_only=parser_only))
+    write_corpus(".".join(example_filename.split(".")[:-1]) + ".corpus", examples)
     return examples
@@ -0,0 +1,290 @@
+import time
+from array import array
+
+from lexicon import get_lexicon
+
+# Node feature naming the form realize should inflect a node's label to, e.g. form=past
+FORM_FEATURE = "form"
+
+# Columns of the inflection table. STE allows the simple present, past and future tenses, and
+# past participles only as adjectives; present_3sg is the form used with singular subjects.
+FORMS = ("base", "present_3sg", "past", "past_participle", "future", "plural")
+
+# Other names accepted for the forms above
+FORM_ALIASES = {"present": "base", "infinitive": "base", "imperative": "base", "singular": "base",
+                "participle": "past_participle"}
+
+VERB_TAGS = ("v", )
+
+NOUN_TAGS = ("n", "tn")
+
+# present_3sg, past and past_participle of the irregular verbs STE texts use
+IRREGULAR_VERBS = {
+    "be": ("is", "was", "been"),
+    "become": ("becomes", "became", "become"),
+    "bend": ("bends", "bent", "bent"),
+    "can": ("can", "could", "could"),
+    "come": ("comes", "came", "come"),
+    "cut": ("cuts", "cut", "cut"),
+    "do": ("does", "did", "done"),
+    "find": ("finds", "found", "found"),
+    "get": ("gets", "got", "got"),
+    "give": ("gives", "gave", "given"),
+    "go": ("goes", "went", "gone"),
+    "have": ("has", "had", "had"),
+    "hold": ("holds", "held", "held"),
+    "keep": ("keeps", "kept", "kept"),
+    "let": ("lets", "let", "let"),
+    "make": ("makes", "made", "made"),
+    "put": ("puts", "put", "put"),
+    "read": ("reads", "read", "read"),
+    "set": ("sets", "set", "set"),
+    "shake": ("shakes", "shook", "shaken"),
+    "show": ("shows", "showed", "shown"),
+    "speak": ("speaks", "spoke", "spoken"),
+    "spin": ("spins", "spun", "spun"),
+    "take": ("takes", "took", "taken"),
+    "tell": ("tells", "told", "told"),
+    "think": ("thinks", "thought", "thought"),
+    "wear": ("wears", "wore", "worn"),
+    "write": ("writes", "wrote", "written"),
+}
+
+# Verbs which take no "will" in the future
+MODAL_VERBS = frozenset(["can"])
+
+# Verbs of more than one syllable stressed on the last, which double a final consonant like "stop" does
+DOUBLING_VERBS = frozenset(["admit", "commit", "compel", "control", "equip", "expel", "incur", "occur", "omit",
+                            "patrol", "permit", "prefer", "propel", "recur", "refer", "regret", "repel", "submit",
+                            "transfer", "transmit"])
+
+IRREGULAR_PLURALS = {
+    "analysis": "analyses",
+    "equipment": "equipment",
+    "foot": "feet",
+    "information": "information",
+    "personnel": "personnel",
+}
+
+# Lexicon entries listed in an inflected form, mapped to their lemmas
+LEMMA_CORRECTIONS = {"approved": "approve", "prevents": "prevent", "are": "be", "is": "be", "was": "be",
+                     "were": "be"}
+
+_VOWELS = "aeiou"
+
+
+def _third_person(verb):
+    if verb in IRREGULAR_VERBS:
+        return IRREGULAR_VERBS[verb][0]
+    if verb.endswith(("s", "x", "z", "ch", "sh", "o")):
+        return verb + "es"
+    if len(verb) > 1 and verb.endswith("y") and verb[-2] not in _VOWELS:
+        return verb[:-1] + "ies"
+    return verb + "s"
+
+
+def _doubles_final_consonant(word):
+    # One-syllable words ending consonant-vowel-consonant double it: stop, stopped
+    if word in DOUBLING_VERBS:
+        return True
+    return (len(word) >= 3 and word[-1] not in _VOWELS + "wxy" and word[-2] in _VOWELS
+            and word[-3] not in _VOWELS and sum(1 for letter in word if letter in _VOWELS) == 1)
+
+
+def _past(verb, participle=False):
+    if verb in IRREGULAR_VERBS:
+        return IRREGULAR_VERBS[verb][2 if participle else 1]
+    if verb.endswith("e"):
+        return verb + "d"
+    if len(verb) > 1 and verb.endswith("y") and verb[-2] not in _VOWELS:
+        return verb[:-1] + "ied"
+    if _doubles_final_consonant(verb):
+        return verb + verb[-1] + "ed"
+    return verb + "ed"
+
+
+def _plural(noun):
+    if noun in IRREGULAR_PLURALS:
+        return IRREGULAR_PLURALS[noun]
+    if noun.endswith(("s", "x", "z", "ch", "sh")):
+        return noun + "es"
+    if len(noun) > 1 and noun.endswith("y") and noun[-2] not in _VOWELS:
+        return noun[:-1] + "ies"
+    return noun + "s"
+
+
+def inflection_forms(word, pos_tags):
+    """
+    :param word: a lemma, possibly of several words; verbs inflect their first word and nouns their last
+    :type word: str
+    :param pos_tags: the lexicon parts of speech of the word; with none, only verb forms are made
+    :type pos_tags: tuple
+    :return: the word's forms, in the order of FORMS; forms its parts of speech lack are the base form
+    :rtype: tuple
+    """
+    lemma = LEMMA_CORRECTIONS.get(word, word)
+    words = lemma.split(" ")
+    is_verb = not pos_tags or any(tag in VERB_TAGS for tag in pos_tags)
+    is_noun = any(tag in NOUN_TAGS for tag in pos_tags)
+
+    def with_first(first):
+        return " ".join([first] + words[1:])
+
+    if is_verb:
+        verb = words[0]
+        present_3sg = with_first(_third_person(verb))
+        past = with_first(_past(verb))
+        past_participle = with_first(_past(verb, participle=True))
+        future = lemma if verb in MODAL_VERBS else "will " + lemma
+    else:
+        present_3sg = past = past_participle = future = lemma
+    plural = " ".join(words[:-1] + [_plural(words[-1])]) if is_noun else lemma
+    return lemma, present_3sg, past, past_participle, future, plural
+
+
+class InflectionTable(object):
+    __slots__ = ("strings", "string_ids", "index", "table")
+
+    def __init__(self):
+        """
+        Precomputed inflections, stored as one row of string ids per lemma in a flat int array.
+
+        Lemmas missing from the table are inflected by rule the first time they are seen and
+        appended to it, as nouns if a plural was asked for and as verbs otherwise; irregular verbs
+        always as verbs.
+        """
+        self.strings = []
+        self.string_ids = {}
+        self.index = {}
+        self.table = array('i')
+
+    @classmethod
+    def from_lexicon(cls, lexicon=None):
+        """
+        :param lexicon: defaults to the shared STE lexicon
+        :type lexicon: lexicon.Lexicon
+        :rtype: InflectionTable
+        """
+        if lexicon is None:
+            lexicon = get_lexicon()
+        table = cls()
+        for word in lexicon.words():
+            table.add(word, lexicon.pos_tags(word))
+        return table
+
+    def _intern(self, string):
+        string_id = self.string_ids.get(string)
+        if string_id is None:
+            string_id = self.string_ids[string] = len(self.strings)
+            self.strings.append(string)
+        return string_id
+
+    def add(self, word, pos_tags=()):
+        """
+        :param word: the lemma to add
+        :type word: str
+        :param pos_tags: its parts of speech
+        :type pos_tags: tuple
+        :return: the lemma's row in the table
+        :rtype: int
+        """
+        lower = word.lower()
+        if lower != word and lower in self.index:
+            forms = self.forms(lower)
+        else:
+            forms = inflection_forms(lower, pos_tags)
+        if lower != word and word[:1].isupper():
+            forms = [form[:1].upper() + form[1:] for form in forms]
+        row = self.index[word] = len(self.table) // len(FORMS)
+        self.table.extend(self._intern(form) for form in forms)
+        # an entry listed in an inflected form, such as "are", makes its lemma known too
+        self.index.setdefault(forms[0], row)
+        return row
+
+    def forms(self, lemma):
+        """
+        :return: the lemma's forms, in the order of FORMS
+        :rtype: tuple
+        """
+        row = self.index.get(lemma)
+        if row is None:
+            row = self.add(lemma)
+        width = len(FORMS)
+        return tuple(self.strings[string_id] for string_id in self.table[row * width:(row + 1) * width])
+
+    def inflect(self, lemmas, forms):
+        """
+        Inflects a batch of words, such as all the nodes of a sentence or corpus.
+
+        :param lemmas: the words to inflect
+        :type lemmas: sequence
+        :param forms: one form name from FORMS or FORM_ALIASES per lemma, or None to leave it as it is
+        :type forms: sequence
+        :return: the inflected words, in input order
+        :rtype: list
+        :raises ValueError: for an unknown form name
+        """
+        width = len(FORMS)
+        columns = {form: column for column, form in enumerate(FORMS)}
+        columns.update((alias, columns[form]) for alias, form in FORM_ALIASES.items())
+        column_get = columns.get
+        plural_column = columns["plural"]
+        index_get = self.index.get
+        table = self.table
+        strings = self.strings
+        inflected = []
+        append = inflected.append
+        for lemma, form in zip(lemmas, forms):
+            if form is None:
+                append(lemma)
+                continue
+            column = column_get(form)
+            if column is None:
+                raise ValueError("unknown form '{}' for '{}'".format(form, lemma))
+            row = index_get(lemma)
+            if row is None:
+                is_noun = column == plural_column and lemma not in IRREGULAR_VERBS and lemma not in LEMMA_CORRECTIONS
+                row = self.add(lemma, NOUN_TAGS[:1] if is_noun else VERB_TAGS)
+            append(strings[table[row * width + column]])
+        return inflected
+
+    def __contains__(self, lemma):
+        return lemma in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+
+_inflection_table = None
+
+
+def get_inflection_table():
+    """
+    :return: the shared InflectionTable for the STE lexicon, built on first use
+    :rtype: InflectionTable
+    """
+    global _inflection_table
+    if _inflection_table is None:
+        _inflection_table = InflectionTable.from_lexicon()
+    return _inflection_table
+
+
+def inflect(lemmas, forms):
+    """
+    Inflects a batch of words with the shared STE inflection table; see InflectionTable.inflect.
+    """
+    return get_inflection_table().inflect(lemmas, forms)
+
+
+if __name__ == "__main__":
+    inflection_table = get_inflection_table()
+    for word in ("park", "put", "put on", "get", "can", "do", "apply", "prevents", "are", "be", "go", "prefer",
+                 "procedure", "analysis"):
+        print("{}: {}".format(word, ", ".join(inflection_table.forms(word))))
+
+    lemmas = [word for word in inflection_table.index] * (1000000 // len(inflection_table) + 1)
+    lemmas = lemmas[:1000000]
+    forms = [FORMS[position % len(FORMS)] for position in range(len(lemmas))]
+    start_time = time.time()
+    inflect(lemmas, forms)
+    print("Inflected {} tokens in {:.3f} seconds".format(len(lemmas), time.time() - start_time))
@@ -3,7 +3,7 @@ lexicon_p = [('pack', 'v'),
              ('pair', 'n'),
              ('parallel', 'adj'),
              ('park', 'v'), # parks, parked, parked, parking(adj)
-             ('part', 'n')
+             ('part', 'n'),
              ('particle', 'n'),
              ('particular', 'adj'), 
              ('paste', 'n'),
@@ -15,7 +15,7 @@ lexicon_p = [('pack', 'v'),
              ('permitted', 'adj'),
              ('person', 'n'),
              ('personnel', 'n'),
-             ('piece', "n'),
+             ('piece', 'n'),
              ('play', 'n'),
              ('plus', 'pre'),
              ('pneumatic', 'adj'),
@@ -0,0 +1,40 @@
+import multiprocessing
+from collections import deque
+from itertools import islice
+
+# Items are pickled to the workers one chunk at a time, so chunks must be large enough
+# that the per-task IPC overhead is small next to the work done on them.
+DEFAULT_CHUNK_SIZE = 512
+
+
+def map_chunks(chunk_function, items, processes=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Applies a function to a stream of items in chunks, across a pool of worker processes.
+
+    Only a few chunks per worker are in flight at once, so arbitrarily long streams can be
+    processed without holding them in memory, and results stream back in input order.
+
+    :param chunk_function: picklable function turning a list of items into a list of one result per item
+    :type chunk_function: callable
+    :param items: the items to process
+    :type items: iterable
+    :param processes: number of worker processes; defaults to one per CPU core
+    :type processes: int
+    :param chunk_size: number of items sent to a worker per task
+    :type chunk_size: int
+    :return: generator over the results, in input order
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    items = iter(items)
+    with multiprocessing.Pool(processes) as pool:
+        pending = deque()
+        while True:
+            while len(pending) < 2 * processes:
+                chunk = list(islice(items, chunk_size))
+                if not chunk:
+                    break
+                pending.append(pool.apply_async(chunk_function, (chunk, )))
+            if not pending:
+                return
+            yield from pending.popleft().get()
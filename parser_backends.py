@@ -0,0 +1,223 @@
+import argparse
+import http.client
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from conllu import CONLLU_COLUMNS, format_conllu, iter_conllu, iter_conllu_lines
+
+# Column layout of the CoNLL-2009 output of the LTH parser test-gen.py talks to
+CONLL2009_COLUMNS = ("id", "form", "lemma", "plemma", "xpos", "pxpos", "feats", "pfeats",
+                     "head", "phead", "deprel", "pdeprel", "fillpred", "pred")
+
+DEFAULT_SENTENCES_PER_REQUEST = 32
+
+DEFAULT_MAX_CONNECTIONS = 4
+
+
+class ParserBackend(object):
+    """
+    Turns raw sentences into DependencyTrees.
+    """
+
+    def parse_batch(self, sentences):
+        """
+        :param sentences: the sentences to parse
+        :type sentences: list
+        :return: one DependencyTree per sentence, in input order
+        :rtype: list
+        """
+        raise NotImplementedError
+
+    def load(self):
+        """
+        Loads any model the backend needs, so that the first parse_batch call does not pay for it.
+        """
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SpacyParserBackend(ParserBackend):
+    def __init__(self, batch_size=1000, n_process=1):
+        """
+        Parses with the shared spaCy model from load_from_spacy, loaded on first use.
+        """
+        self.batch_size = batch_size
+        self.n_process = n_process
+
+    def load(self):
+        from load_from_spacy import get_en_nlp
+        get_en_nlp(parser_only=True)
+
+    def parse_batch(self, sentences):
+        from load_from_spacy import from_spacy_doc, get_en_nlp
+        docs = get_en_nlp(parser_only=True).pipe(sentences, batch_size=self.batch_size, n_process=self.n_process)
+        return [from_spacy_doc(doc)[0] for doc in docs]
+
+
+class FixtureParserBackend(ParserBackend):
+    def __init__(self, conllu_filename):
+        """
+        Answers with pre-parsed trees from a CoNLL-U file, looked up by their ``# text =`` comments.
+
+        :param conllu_filename: path to the CoNLL-U fixture
+        :type conllu_filename: str
+        """
+        self.trees = {sentence: deptree for sentence, deptree in iter_conllu(conllu_filename)}
+
+    def parse_batch(self, sentences):
+        try:
+            return [self.trees[sentence.strip()] for sentence in sentences]
+        except KeyError as error:
+            raise ValueError("no parse for {} in the fixture".format(error)) from None
+
+
+class HTTPParserBackend(ParserBackend):
+    def __init__(self, url, sentences_per_request=DEFAULT_SENTENCES_PER_REQUEST,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, timeout=60, response_columns=CONLLU_COLUMNS):
+        """
+        Client for a parser service which takes form-encoded ``sentence`` fields and answers with CoNLL.
+
+        Connections are kept alive and pooled, and a batch is split into requests of
+        ``sentences_per_request`` sentences which are sent over at most ``max_connections``
+        connections at once.
+
+        :param url: the parse endpoint, e.g. ``http://localhost:8081/parse``
+        :type url: str
+        :param sentences_per_request: sentences sent per request; 1 for services that only take one
+        :type sentences_per_request: int
+        :param max_connections: bound on concurrent requests
+        :type max_connections: int
+        :param timeout: socket timeout in seconds
+        :type timeout: float
+        :param response_columns: column layout of the CoNLL the service answers with
+        :type response_columns: tuple
+        """
+        split_url = urlsplit(url)
+        self.host = split_url.hostname
+        self.port = split_url.port
+        self.path = split_url.path or "/"
+        self.sentences_per_request = sentences_per_request
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.response_columns = response_columns
+        self._connections = queue.LifoQueue()
+        self._executor = ThreadPoolExecutor(max_workers=max_connections)
+
+    def parse_batch(self, sentences):
+        requests = [sentences[start:start + self.sentences_per_request]
+                    for start in range(0, len(sentences), self.sentences_per_request)]
+        return [deptree for deptrees in self._executor.map(self._post, requests) for deptree in deptrees]
+
+    def _post(self, sentences):
+        body = urlencode([("sentence", sentence.strip()) for sentence in sentences])
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            try:
+                connection.request("POST", self.path, body, headers)
+                response = connection.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle keep-alive connection; retry once on a fresh one
+                connection.close()
+                connection.request("POST", self.path, body, headers)
+                response = connection.getresponse()
+            content = response.read().decode('utf-8')
+        except Exception:
+            connection.close()
+            raise
+        if response.status != 200:
+            connection.close()
+            raise IOError("parser service answered {} {}: {}".format(response.status, response.reason, content))
+        if response.will_close:
+            connection.close()
+        else:
+            self._connections.put(connection)
+        deptrees = [deptree for _, deptree in iter_conllu_lines(content.splitlines(), columns=self.response_columns)]
+        if len(deptrees) != len(sentences):
+            raise IOError("parser service returned {} parses for {} sentences".format(len(deptrees), len(sentences)))
+        return deptrees
+
+    def close(self):
+        self._executor.shutdown()
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class _ParseRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode('utf-8')
+        sentences = parse_qs(body, keep_blank_values=True).get("sentence", [])
+        try:
+            deptrees = self.server.backend.parse_batch(sentences)
+        except ValueError as error:
+            self._respond(422, str(error))
+            return
+        self._respond(200, "".join(format_conllu(sentence, deptree)
+                                   for sentence, deptree in zip(sentences, deptrees)))
+
+    def _respond(self, status, content):
+        encoded = content.encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_parser_server(backend, host="localhost", port=0):
+    """
+    Serves a ParserBackend over HTTP on a background thread, as a local stand-in for a remote
+    parser service. Responses are CoNLL-U, one block per sentence, so HTTPParserBackend can
+    talk to it with its default settings.
+
+    :param backend: the backend answering requests
+    :type backend: ParserBackend
+    :param host: interface to listen on
+    :type host: str
+    :param port: port to listen on; 0 picks a free one
+    :type port: int
+    :return: the running server; its parse URL is ``http://host:server.server_port/parse``
+    :rtype: http.server.ThreadingHTTPServer
+    """
+    server = ThreadingHTTPServer((host, port), _ParseRequestHandler)
+    server.daemon_threads = True
+    server.backend = backend
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local parser service.")
+    parser.add_argument("--fixture", help="answer from this CoNLL-U file instead of parsing with spaCy")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+
+    backend = FixtureParserBackend(args.fixture) if args.fixture else SpacyParserBackend()
+    server = ThreadingHTTPServer((args.host, args.port), _ParseRequestHandler)
+    server.backend = backend
+    print("Serving parses on http://{}:{}/parse".format(args.host, server.server_port))
+    server.serve_forever()
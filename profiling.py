@@ -0,0 +1,148 @@
+import json
+import os
+import time
+from collections import defaultdict
+
+# Checked by the instrumented code before doing any profiling work, so that leaving the hooks
+# in costs one attribute lookup per hook when profiling is off. Set CNL_PROFILE=1 to start enabled.
+enabled = bool(os.environ.get("CNL_PROFILE"))
+
+PROMETHEUS_PREFIX = "cnl_"
+
+timer = time.perf_counter
+
+_stage_calls = defaultdict(int)
+_stage_seconds = defaultdict(float)
+_counters = defaultdict(lambda: defaultdict(int))
+_caches = {}
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    """
+    Forgets all timings and counts, but keeps the watched caches.
+    """
+    _stage_calls.clear()
+    _stage_seconds.clear()
+    _counters.clear()
+
+
+def record(stage, start_time):
+    """
+    Adds the time since ``start_time`` to a stage. Hooks take ``start_time = profiling.timer()``
+    when profiling is enabled and call this when the stage is done.
+
+    :param stage: name of the pipeline stage, e.g. ``realize``
+    :type stage: str
+    :param start_time: value of profiling.timer() when the stage started
+    :type start_time: float
+    """
+    _stage_calls[stage] += 1
+    _stage_seconds[stage] += timer() - start_time
+
+
+def count(counter, key, amount=1):
+    """
+    :param counter: what is being counted, e.g. ``dependency_label``
+    :type counter: str
+    :param key: the value counted, e.g. ``nsubj``
+    :param amount: how much to add
+    :type amount: int
+    """
+    _counters[counter][key] += amount
+
+
+def watch_cache(name, cache):
+    """
+    Includes a cache's hit rate in the reports.
+
+    :param name: name the cache is reported under
+    :type name: str
+    :param cache: an object with ``hits`` and ``misses`` attributes, like RealizationCache,
+                  or a function wrapped by functools.lru_cache
+    """
+    _caches[name] = cache
+
+
+def _cache_stats(cache):
+    if hasattr(cache, "cache_info"):
+        info = cache.cache_info()
+        return info.hits, info.misses
+    return cache.hits, cache.misses
+
+
+def snapshot():
+    """
+    :return: per-stage call counts and seconds, the counters and the hit rates of the watched caches
+    :rtype: dict
+    """
+    caches = {}
+    for name, cache in _caches.items():
+        hits, misses = _cache_stats(cache)
+        caches[name] = {"hits": hits, "misses": misses,
+                        "hit_rate": hits / (hits + misses) if hits + misses else 0.0}
+    return {
+        "enabled": enabled,
+        "stages": {stage: {"calls": _stage_calls[stage], "seconds": _stage_seconds[stage]}
+                   for stage in _stage_calls},
+        "counters": {counter: {str(key): value for key, value in keys.items()}
+                     for counter, keys in _counters.items()},
+        "caches": caches,
+    }
+
+
+def to_json(indent=2):
+    return json.dumps(snapshot(), indent=indent, sort_keys=True)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def to_prometheus():
+    """
+    :return: the snapshot in the Prometheus text exposition format
+    :rtype: str
+    """
+    stats = snapshot()
+    lines = []
+
+    def metric(name, metric_type, samples):
+        lines.append("# TYPE {}{} {}".format(PROMETHEUS_PREFIX, name, metric_type))
+        for labels, value in samples:
+            label_string = ",".join("{}=\"{}\"".format(label, _escape_label(label_value))
+                                    for label, label_value in labels)
+            lines.append("{}{}{{{}}} {}".format(PROMETHEUS_PREFIX, name, label_string, repr(float(value))))
+
+    stages = sorted(stats["stages"].items())
+    metric("stage_calls_total", "counter", [((("stage", stage), ), values["calls"]) for stage, values in stages])
+    metric("stage_seconds_total", "counter", [((("stage", stage), ), values["seconds"]) for stage, values in stages])
+    metric("events_total", "counter", [((("counter", counter), ("key", key)), value)
+                                       for counter, keys in sorted(stats["counters"].items())
+                                       for key, value in sorted(keys.items())])
+    caches = sorted(stats["caches"].items())
+    metric("cache_hits_total", "counter", [((("cache", name), ), values["hits"]) for name, values in caches])
+    metric("cache_misses_total", "counter", [((("cache", name), ), values["misses"]) for name, values in caches])
+    metric("cache_hit_ratio", "gauge", [((("cache", name), ), values["hit_rate"]) for name, values in caches])
+    return "\n".join(lines) + "\n"
+
+
+def dump(filename):
+    """
+    Writes the snapshot to a file, in Prometheus text format if the name ends in ``.prom``
+    and as JSON otherwise.
+
+    :param filename: path of the file to write
+    :type filename: str
+    """
+    with open(filename, 'w') as dump_file:
+        dump_file.write(to_prometheus() if filename.endswith(".prom") else to_json())
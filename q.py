@@ -1,3 +1,3 @@
 lexicon_q = [('quality', 'n'),
              ('quantity', 'n'),
-             ('quickly', 'adv']
+             ('quickly', 'adv')]
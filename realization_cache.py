@@ -0,0 +1,116 @@
+from collections import OrderedDict
+from hashlib import blake2b
+
+DEFAULT_MAXSIZE = 65536
+
+DIGEST_SIZE = 16
+
+
+class RealizationCache(object):
+    def __init__(self, maxsize=DEFAULT_MAXSIZE):
+        """
+        Bounded LRU mapping from subtree digests to their realized tokens.
+
+        :param maxsize: number of realizations to keep before evicting the least recently used
+        :type maxsize: int
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """
+        :param key: the key a realization was stored under
+        :type key: bytes
+        :return: the cached tokens, or None if there are none
+        :rtype: tuple
+        """
+        tokens = self._entries.get(key)
+        if tokens is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return tokens
+
+    def put(self, key, tokens):
+        """
+        :param key: digest-based key of the realized subtree
+        :type key: bytes
+        :param tokens: the realized tokens
+        :type tokens: tuple
+        """
+        self._entries[key] = tokens
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def _node_digest(label, features, child_digests):
+    node_hash = blake2b(digest_size=DIGEST_SIZE)
+    for string in [label] + [part for item in sorted(features) for part in item]:
+        encoded = str(string).encode('utf-8')
+        node_hash.update(b"%d:" % len(encoded))
+        node_hash.update(encoded)
+    node_hash.update(b"%d|" % len(child_digests))
+    for child_digest in child_digests:
+        node_hash.update(child_digest)
+    return node_hash.digest()
+
+
+def subtree_digests(deptree):
+    """
+    Computes a canonical digest for every subtree of a DependencyTree in one bottom-up pass.
+
+    A node's digest covers its label, its features and the ordered digests of its children,
+    so equal subtrees get equal digests wherever they occur.
+
+    :param deptree: the tree to digest
+    :type deptree: DependencyTree
+    :return: mapping from id() of each node to its digest
+    :rtype: dict
+    """
+    digests = {}
+    stack = [(deptree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if children_done:
+            digests[id(node)] = _node_digest(node.label(), node.features.items(),
+                                             [digests[id(child)] for child in node])
+        else:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node)
+    return digests
+
+
+def compact_subtree_digests(tree, children):
+    """
+    Computes the digest of every subtree of a CompactDependencyTree, matching subtree_digests.
+
+    :param tree: the tree to digest
+    :type tree: CompactDependencyTree
+    :param children: the tree's child index lists, as returned by its children() method
+    :type children: list
+    :return: the digest of each node, by node index
+    :rtype: list
+    """
+    digests = [None] * len(tree)
+    # Pre-order storage puts every child after its head, so walking backwards sees children first
+    for index in range(len(tree) - 1, -1, -1):
+        digests[index] = _node_digest(tree.label(index), tree.features(index).items(),
+                                      [digests[child] for child in children[index]])
+    return digests
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from conllu import iter_conllu_lines
+from lexicon import get_lexicon
+from parser_backends import FixtureParserBackend, SpacyParserBackend
+from sentplan import parse_pred_logic_to_sp
+from sentplan_compiler import SentPlanCompiler, realize_plans
+from ste_realization import realize_batch
+
+DEFAULT_MAX_BATCH_SIZE = 256
+
+DEFAULT_MAX_DELAY = 0.005
+
+# Number of recent requests per kind kept for latency percentiles
+LATENCY_WINDOW = 10000
+
+
+class MicroBatcher(object):
+    def __init__(self, process_batch, executor, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_delay=DEFAULT_MAX_DELAY):
+        """
+        Collects concurrent requests into batches for a function that works on many inputs at once.
+
+        A batch is dispatched when it reaches ``max_batch_size`` items or when ``max_delay``
+        seconds have passed since its first item arrived, whichever comes first.
+
+        :param process_batch: takes a list of inputs and returns a list of results in the same order
+        :type process_batch: callable
+        :param executor: where process_batch runs, off the event loop
+        :type executor: concurrent.futures.Executor
+        :param max_batch_size: largest batch to dispatch
+        :type max_batch_size: int
+        :param max_delay: longest time in seconds a request waits for its batch to fill
+        :type max_delay: float
+        """
+        self.process_batch = process_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.batch_sizes = deque(maxlen=LATENCY_WINDOW)
+        self._queue = None
+        self._worker = None
+
+    async def submit(self, item):
+        """
+        :param item: one input for process_batch
+        :return: its result
+        """
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.ensure_future(self._run())
+        start_time = time.perf_counter()
+        future = asyncio.get_event_loop().create_future()
+        await self._queue.put((item, future))
+        try:
+            return await future
+        finally:
+            self.latencies.append(time.perf_counter() - start_time)
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batch_sizes.append(len(batch))
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self.executor, self.process_batch, items)
+            except Exception:
+                # Find out which requests failed so that one bad input does not fail its whole batch
+                results = await loop.run_in_executor(self.executor, self._process_individually, items)
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            # A batch function returning too few results must not leave requests waiting forever
+            for _, future in batch[len(results):]:
+                if not future.done():
+                    future.set_exception(ValueError("batch function returned {} results for {} inputs".format(
+                        len(results), len(batch))))
+
+    def _process_individually(self, items):
+        results = []
+        for item in items:
+            try:
+                results.append(self.process_batch([item])[0])
+            except Exception as error:
+                results.append(error)
+        return results
+
+    def stats(self):
+        """
+        :return: request count, latency percentiles in milliseconds and mean batch size over the recent window
+        :rtype: dict
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {"requests": 0}
+        return {"requests": len(latencies),
+                "p50_ms": 1000 * latencies[int(0.50 * (len(latencies) - 1))],
+                "p99_ms": 1000 * latencies[int(0.99 * (len(latencies) - 1))],
+                "mean_batch_size": sum(self.batch_sizes) / len(self.batch_sizes)}
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+
+
+class RealizationServer(object):
+    def __init__(self, parser_backend=None, with_stemming=False, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_delay=DEFAULT_MAX_DELAY):
+        """
+        Answers realization requests sent as JSON lines over TCP or a Unix socket.
+
+        Each request is a JSON object with an optional ``id``, echoed in the response, and one of
+        the keys ``tree`` (a CoNLL-U block), ``sentence`` (raw text to parse and realize),
+        ``pred_logic`` (a sentence plan to compile and realize) or ``stats``. Responses are JSON
+        objects on one line each, holding ``realization`` (with the parsed ``plan`` for sentence
+        plans), ``stats`` or ``error``. Requests on one connection are handled concurrently and may
+        be answered out of order.
+
+        The parser backend and the lexicon are loaded once, when the server is created.
+
+        :param parser_backend: parses raw sentences; defaults to spaCy
+        :type parser_backend: parser_backends.ParserBackend
+        :param with_stemming: whether to stem node labels when realizing
+        :type with_stemming: bool
+        """
+        if parser_backend is None:
+            parser_backend = SpacyParserBackend()
+        self.parser_backend = parser_backend
+        self.parser_backend.load()
+        self.with_stemming = with_stemming
+        self.lexicon = get_lexicon()
+        self.sentplan_compiler = SentPlanCompiler(lexicon=self.lexicon)
+        # Realization and parsing hold the GIL, so one worker thread keeps them off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self.batchers = {
+            "tree": MicroBatcher(self._realize_trees, self._executor, max_batch_size, max_delay),
+            "sentence": MicroBatcher(self._realize_sentences, self._executor, max_batch_size, max_delay),
+            "pred_logic": MicroBatcher(self._realize_plans, self._executor, max_batch_size, max_delay),
+        }
+
+    def _realize_trees(self, conllu_blocks):
+        deptrees = []
+        for block in conllu_blocks:
+            examples = list(iter_conllu_lines(block.splitlines()))
+            if len(examples) != 1:
+                raise ValueError("tree must be a single CoNLL-U sentence, got {}".format(len(examples)))
+            deptrees.append(examples[0][1])
+        return realize_batch(deptrees, self.with_stemming)
+
+    def _realize_sentences(self, sentences):
+        return realize_batch(self.parser_backend.parse_batch(sentences), self.with_stemming)
+
+    def _realize_plans(self, pred_logic_strings):
+        sentplans = [parse_pred_logic_to_sp(pred_logic, with_features=True) for pred_logic in pred_logic_strings]
+        realizations = realize_plans(sentplans, self.with_stemming, compiler=self.sentplan_compiler)
+        return [(sentplan.pformat(margin=float('inf')), realization)
+                for sentplan, realization in zip(sentplans, realizations)]
+
+    async def handle_request(self, request):
+        """
+        :param request: a decoded request object
+        :type request: dict
+        :return: the response object
+        :rtype: dict
+        """
+        response = {"id": request.get("id")}
+        try:
+            if "stats" in request:
+                response["stats"] = {kind: batcher.stats() for kind, batcher in self.batchers.items()}
+            elif "tree" in request:
+                response["realization"] = await self.batchers["tree"].submit(request["tree"])
+            elif "sentence" in request:
+                response["realization"] = await self.batchers["sentence"].submit(request["sentence"])
+            elif "pred_logic" in request:
+                response["plan"], response["realization"] = await self.batchers["pred_logic"].submit(
+                    request["pred_logic"])
+            else:
+                response["error"] = "request needs one of tree, sentence, pred_logic or stats"
+        except ValueError as error:
+            response["error"] = str(error)
+        except Exception as error:
+            # Any failure must still be answered, or the client waits for this id forever
+            response["error"] = "{}: {}".format(type(error).__name__, error)
+        return response
+
+    async def _handle_line(self, line, writer, write_lock):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+        except ValueError as error:
+            response = {"id": None, "error": "malformed request: {}".format(error)}
+        else:
+            response = await self.handle_request(request)
+        # Drain under the lock: a client that stops reading must block its own responses instead
+        # of letting them pile up in the transport buffer, and concurrent drains must not interleave.
+        async with write_lock:
+            writer.write(json.dumps(response).encode('utf-8') + b"\n")
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        tasks = set()
+        write_lock = asyncio.Lock()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(self._handle_line(line, writer, write_lock))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.wait(tasks)
+        finally:
+            writer.close()
+
+    async def serve(self, host="localhost", port=8765, unix_socket=None):
+        """
+        Serves requests until cancelled.
+
+        :param host: interface to listen on for TCP
+        :param port: TCP port
+        :param unix_socket: path of a Unix socket to listen on instead of TCP
+        """
+        if unix_socket:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        for batcher in self.batchers.values():
+            batcher.close()
+        self._executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve STE realization over TCP or a Unix socket.")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix-socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--fixture", help="answer sentence requests from this CoNLL-U file instead of spaCy")
+    parser.add_argument("--stem", action="store_true", help="stem node labels when realizing")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE)
+    parser.add_argument("--max-delay-ms", type=float, default=1000 * DEFAULT_MAX_DELAY)
+    args = parser.parse_args()
+
+    backend = FixtureParserBackend(args.fixture) if args.fixture else SpacyParserBackend()
+    realization_server = RealizationServer(backend, args.stem, args.max_batch_size, args.max_delay_ms / 1000)
+    try:
+        asyncio.run(realization_server.serve(args.host, args.port, args.unix_socket))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        realization_server.close()
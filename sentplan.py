@@ -1,8 +1,127 @@
+import re
+import time
+
 from nltk.tree import Tree
-from nltk.compat import string_types
+
+from tree_format import pformat_flat, pformat_tree
+
+
+# Splits a pred-logic string into brackets, commas and the atoms between them
+_PRED_LOGIC_TOKENS = re.compile(r"[(),]|[^(),]+")
+
+
+class PredLogicSyntaxError(ValueError):
+    def __init__(self, message, position, line_number=None):
+        """
+        :param message: what is wrong with the input
+        :param position: character offset of the error in the pred-logic string
+        :param line_number: line of the error when parsing a file of plans
+        """
+        self.message = message
+        self.position = position
+        self.line_number = line_number
+        if line_number is None:
+            super().__init__("{} at position {}".format(message, position))
+        else:
+            super().__init__("{} at line {}, position {}".format(message, line_number, position))
 
 
 def parse_pred_logic_to_sp(sp_string, with_features=False):
+    """
+    Parses a pred-logic string such as ``measure:mood=imp(necessary(time, absorb(...)))`` into a SentPlan.
+
+    The string is tokenized and parsed in a single left-to-right pass with an explicit stack,
+    so the cost is linear in its length however deeply the predicates are nested.
+    Whitespace around predicate names is ignored.
+
+    :param sp_string: the pred-logic representation of the plan
+    :type sp_string: str
+    :param with_features: whether to split ``:feature=value`` suffixes off the predicate names
+    :type with_features: bool
+    :return: the root of the sentence plan
+    :rtype: SentPlan
+    :raises PredLogicSyntaxError: if the string is malformed
+    """
+    open_nodes = []
+    node = None
+    previous_token = None
+    for match in _PRED_LOGIC_TOKENS.finditer(sp_string):
+        token = match.group()
+        position = match.start()
+        if token == "(":
+            if node is None or previous_token != "atom":
+                raise PredLogicSyntaxError("'(' without a predicate", position)
+            open_nodes.append((node, position))
+            node = None
+        elif token == ",":
+            if not open_nodes:
+                raise PredLogicSyntaxError("',' outside of an argument list", position)
+            if node is None:
+                raise PredLogicSyntaxError("missing argument", position)
+            open_nodes[-1][0].append(node)
+            node = None
+        elif token == ")":
+            if not open_nodes:
+                raise PredLogicSyntaxError("unbalanced ')'", position)
+            if node is not None:
+                open_nodes[-1][0].append(node)
+            elif previous_token != "(":
+                raise PredLogicSyntaxError("missing argument", position)
+            node = open_nodes.pop()[0]
+        else:
+            label = token.strip()
+            if not label:
+                continue
+            if node is not None:
+                raise PredLogicSyntaxError("unexpected predicate '{}'".format(label),
+                                           position + token.index(label))
+            node = _pred_logic_node(label, with_features, position + token.index(label))
+            token = "atom"
+        previous_token = token
+    if open_nodes:
+        raise PredLogicSyntaxError("unclosed '('", open_nodes[-1][1])
+    if node is None:
+        raise PredLogicSyntaxError("empty sentence plan", len(sp_string))
+    return node
+
+
+def _pred_logic_node(label, with_features, position):
+    if not with_features:
+        return SentPlan(label)
+    parts = label.split(":")
+    feature_dict = {}
+    for feature in parts[1:]:
+        if feature.count("=") != 1:
+            raise PredLogicSyntaxError("malformed feature '{}'".format(feature), position + label.index(feature))
+        feature, value = feature.split("=")
+        feature_dict[feature] = value
+    return SentPlan(parts[0], features=feature_dict)
+
+
+def iter_pred_logic_file(plan_filename, with_features=False):
+    """
+    Streams the sentence plans in a file holding one pred-logic string per line.
+
+    Blank lines are skipped. Syntax errors report the line they occur on.
+
+    :param plan_filename: path to the file of plans
+    :type plan_filename: str
+    :param with_features: whether to parse ``:feature=value`` suffixes
+    :type with_features: bool
+    :return: generator over SentPlan objects
+    """
+    with open(plan_filename, 'r') as plan_file:
+        for line_number, line in enumerate(plan_file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield parse_pred_logic_to_sp(line, with_features)
+            except PredLogicSyntaxError as error:
+                raise PredLogicSyntaxError(error.message, error.position, line_number) from None
+
+
+def _parse_pred_logic_to_sp_recursive(sp_string, with_features=False):
+    # The original split-and-recurse parser, kept as the baseline for the benchmark below
     parts = sp_string.split("(")
     node_label = parts[0]
     if with_features:
@@ -30,7 +149,7 @@ def parse_pred_logic_to_sp(sp_string, with_features=False):
 
     if arg:
         args.append("".join(arg))
-    children = [parse_pred_logic_to_sp(arg, with_features) for arg in args]
+    children = [_parse_pred_logic_to_sp_recursive(arg, with_features) for arg in args]
     if with_features:
         return SentPlan(node_label, features=feature_dict, children=children)
     else:
@@ -84,55 +203,10 @@ class SentPlan(Tree):
         :return: A pretty-printed string representation of this tree.
         :rtype: str
         """
-
-        # Try writing it on one line.
-        s = self._pformat_flat(nodesep, parens, quotes, with_features)
-        if len(s) + indent < margin:
-            return s
-
-        # If it doesn't fit on one line, then write it on multi-lines.
-        if isinstance(self._label, string_types):
-            output_label = self._label
-            if with_features:
-                for feature in self.features:
-                    output_label += ":{}={}".format(feature, self.features[feature])
-            s = '%s%s%s' % (parens[0], output_label, nodesep)
-        else:
-            s = '%s%s%s' % (parens[0], str(self._label), nodesep)
-        for child in self:
-            if isinstance(child, Tree):
-                s += '\n' + ' ' * (indent + 2) + child.pformat(margin, indent + 2, nodesep, parens, quotes, with_features)
-            elif isinstance(child, tuple):
-                s += '\n' + ' ' * (indent + 2) + "/".join(child)
-            elif isinstance(child, string_types) and not quotes:
-                s += '\n' + ' ' * (indent + 2) + '%s' % child
-            else:
-                s += '\n' + ' ' * (indent + 2) + str(child)
-        return s + parens[1]
+        return pformat_tree(self, margin, indent, nodesep, parens, quotes, with_features, tree_type=Tree)
 
     def _pformat_flat(self, nodesep, parens, quotes, with_features=True):
-        child_strings = []
-        for child in self:
-            if isinstance(child, Tree):
-                child_strings.append(child._pformat_flat(nodesep, parens, quotes, with_features))
-            elif isinstance(child, tuple):
-                child_strings.append("/".join(child))
-            elif isinstance(child, string_types) and not quotes:
-                child_strings.append('%s' % child)
-            else:
-                child_strings.append(str(child))
-        if isinstance(self._label, string_types):
-            if with_features:
-                output_label = self._label
-                for feature in self.features:
-                    output_label += ":{}={}".format(feature, self.features[feature])
-            else:
-                output_label = self._label
-            return '%s%s%s %s%s' % (parens[0], output_label, nodesep,
-                                    " ".join(child_strings), parens[1])
-        else:
-            return '%s%s%s %s%s' % (parens[0], str(self._label), nodesep,
-                                    " ".join(child_strings), parens[1])
+        return pformat_flat(self, nodesep, parens, quotes, with_features, tree_type=Tree)
 
 
 if __name__ == "__main__":
@@ -147,4 +221,14 @@ if __name__ == "__main__":
     # Test importing and printing with features
     test_with_features = parse_pred_logic_to_sp(test_measure_silica_gel_absorption_w_props, with_features=True)
     print(test_with_features)
-    print(test_with_features.features)
\ No newline at end of file
+    print(test_with_features.features)
+    # Compare throughput with the recursive parser on deeply nested plans
+    for depth in (10, 100, 300):
+        deep_plan = "f:mood=imp(" * depth + "x:det=def" + ", y)" * depth
+        for parser in (_parse_pred_logic_to_sp_recursive, parse_pred_logic_to_sp):
+            repetitions = max(1, 2000 // depth)
+            start_time = time.time()
+            for _ in range(repetitions):
+                parser(deep_plan, with_features=True)
+            elapsed = (time.time() - start_time) / repetitions
+            print("{}: depth {}, {:.0f} plans/second".format(parser.__name__, depth, 1 / elapsed))
@@ -0,0 +1,472 @@
+import argparse
+import itertools
+import os
+import re
+import sys
+import time
+
+from deptree import DependencyTree
+from lexicon import get_lexicon
+from realization_cache import RealizationCache
+from sentplan import iter_pred_logic_file, parse_pred_logic_to_sp
+from ste_realization import realize_batch
+
+RULES_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sentplan_rules.tsv")
+
+WILDCARD = "*"
+
+# The word of a feature rule for a value which adds no function word
+NO_WORD = "-"
+
+DEFAULT_CACHE_SIZE = 65536
+
+DEFAULT_BATCH_SIZE = 1000
+
+# The example sentences of README.md with their sentence plans; run this module to check them
+README_EXAMPLES = [
+    ("measure:mood=imp(necessary(time:det=def, absorb:mood=inf(silica_gel:det=def, moisture:det=def)))",
+     "Measure the time necessary for the silica gel to absorb the moisture."),
+    ("clean:mood=imp(skin:det=your, with(quantity:det=indef(large:pos=adj, of(water:pos=n(clean:pos=adj)))))",
+     "Clean your skin with a large quantity of clean water."),
+    ("absorbs(shock_mount:det=def, vibration:det=def)",
+     "The shock mount absorbs the vibration."),
+    ("clean:mood=imp:polarity=neg(door:det=def)",
+     "Do not clean the door."),
+]
+
+# A space realize leaves before punctuation
+_SPACE_BEFORE_PUNCTUATION = re.compile(r" +(?=[.,;:!?](?: |$))")
+
+# Suffixes guess_pos reads as marking adjectives and adverbs
+ADJECTIVE_SUFFIXES = ("able", "ible", "al", "ary", "ful", "ic", "ive", "less", "ous")
+
+ADVERB_SUFFIXES = ("ly", )
+
+# Closed class words guess_pos knows, for prepositions missing from the lexicon
+PREPOSITIONS = frozenset(["about", "above", "across", "after", "against", "along", "around", "at", "before",
+                          "behind", "below", "between", "by", "during", "for", "from", "in", "into", "near", "of",
+                          "off", "on", "onto", "out", "over", "through", "to", "under", "until", "with", "without"])
+
+
+class CompilationRules(object):
+    def __init__(self, pos_by_tag, arguments, features, splits, end_words):
+        """
+        Compiled rule table for turning SentPlans into DependencyTrees.
+
+        :param pos_by_tag: the part of speech to compile each lexicon tag as
+        :type pos_by_tag: dict
+        :param arguments: (head_pos, mood, position, arg_pos, dep, function_word) rules in priority order
+        :type arguments: list
+        :param features: (name, value) to the (word, dep, condition) children a node with that feature gets,
+                         where condition is a (name, value) feature the node must also have, or None
+        :type features: dict
+        :param splits: part of speech to (head, dep) for labels joined by underscores
+        :type splits: dict
+        :param end_words: (word, dep) pairs attached to every root
+        :type end_words: list
+        """
+        self.pos_by_tag = pos_by_tag
+        self.arguments = arguments
+        self.features = features
+        self.feature_names = frozenset(name for name, _ in features)
+        self.splits = splits
+        self.end_words = end_words
+        self._resolved = {}
+
+    def argument(self, head_pos, mood, position, arg_pos):
+        """
+        :return: the dependency label of an argument and the (word, dep) function word it brings, or None
+        :rtype: tuple
+        :raises ValueError: if no rule matches
+        """
+        key = (head_pos, mood, position, arg_pos)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            for rule_head_pos, rule_mood, rule_position, rule_arg_pos, dep, function_word in self.arguments:
+                if ((rule_head_pos == WILDCARD or rule_head_pos == head_pos)
+                        and (rule_mood == WILDCARD or rule_mood == mood)
+                        and (rule_position == WILDCARD or rule_position == position)
+                        and (rule_arg_pos == WILDCARD or rule_arg_pos == arg_pos)):
+                    resolved = self._resolved[key] = (dep, function_word)
+                    break
+            else:
+                raise ValueError("no arg rule for argument {} ({}) of a {} with mood {}".format(
+                    position, arg_pos, head_pos, mood))
+        return resolved
+
+    def function_words(self, feature_items):
+        """
+        :param feature_items: the (name, value) features of a node
+        :type feature_items: tuple
+        :return: the (word, dep) function words the feature rules give the node, in feature order
+        :rtype: list
+        :raises ValueError: if a feature has a value the feature rules for its name do not know
+        """
+        words = []
+        for item in feature_items:
+            if item[0] not in self.feature_names:
+                continue
+            rules = self.features.get(item)
+            if rules is None:
+                raise ValueError("no feature rule for {}={}".format(*item))
+            for word, dep, condition in rules:
+                if condition is None or condition in feature_items:
+                    words.append((word, dep))
+        return words
+
+    def split(self, pos):
+        """
+        :return: whether the "first" or "last" word heads an underscored label of this part of speech, and the
+                 dependency label of the other words
+        :rtype: tuple
+        """
+        return self.splits.get(pos) or self.splits.get(WILDCARD) or ("last", "compound")
+
+
+def parse_rules(lines, source="<rules>"):
+    """
+    Compiles SentPlan compilation rules from lines in the format of sentplan_rules.tsv.
+
+    :param lines: the rule lines, e.g. an open file
+    :type lines: iterable
+    :param source: name of the rules for error messages
+    :type source: str
+    :rtype: CompilationRules
+    :raises ValueError: if a rule is malformed
+    """
+    pos_by_tag = {}
+    arguments = []
+    features = {}
+    splits = {}
+    end_words = []
+    for line_number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.lstrip().startswith("#"):
+            continue
+        fields = [field.strip() for field in line.split("\t")]
+        kind = fields[0]
+
+        def error(message):
+            return ValueError("{}, line {}: {}".format(source, line_number, message))
+
+        if kind == "pos":
+            if len(fields) != 3:
+                raise error("pos needs a lexicon tag and a part of speech")
+            pos_by_tag[fields[1]] = fields[2]
+        elif kind == "arg":
+            if len(fields) not in (6, 7):
+                raise error("arg needs a head part of speech, a mood, a position, an argument part of speech, "
+                            "a dependency label and optionally WORD:DEP")
+            position = fields[3]
+            if position != WILDCARD:
+                if not position.isdigit():
+                    raise error("position must be a number or '{}'".format(WILDCARD))
+                position = int(position)
+            function_word = None
+            if len(fields) == 7:
+                if fields[6].count(":") != 1:
+                    raise error("function word must be written WORD:DEP")
+                function_word = tuple(fields[6].split(":"))
+            arguments.append((fields[1], fields[2], position, fields[4], fields[5], function_word))
+        elif kind == "feature":
+            if len(fields) not in (5, 6):
+                raise error("feature needs a feature name, a value, a word, a dependency label "
+                            "and optionally NAME=VALUE")
+            condition = None
+            if len(fields) == 6:
+                if fields[5].count("=") != 1:
+                    raise error("condition must be written NAME=VALUE")
+                condition = tuple(fields[5].split("="))
+            rules = features.setdefault((fields[1], fields[2]), [])
+            if fields[3] != NO_WORD:
+                rules.append((fields[3], fields[4], condition))
+        elif kind == "split":
+            if len(fields) != 4 or fields[2] not in ("first", "last"):
+                raise error("split needs a part of speech, 'first' or 'last', and a dependency label")
+            splits[fields[1]] = (fields[2], fields[3])
+        elif kind == "end":
+            if len(fields) != 3:
+                raise error("end needs a word and a dependency label")
+            end_words.append((fields[1], fields[2]))
+        else:
+            raise error("unknown rule kind '{}'".format(kind))
+    if not arguments:
+        raise ValueError("{}: no arg rules".format(source))
+    return CompilationRules(pos_by_tag, arguments, features, splits, end_words)
+
+
+def load_rules(rules_filename=RULES_FILENAME):
+    """
+    :param rules_filename: path to a rules file; defaults to sentplan_rules.tsv next to this module
+    :type rules_filename: str
+    :rtype: CompilationRules
+    """
+    with open(rules_filename, 'r', encoding='utf-8') as rules_file:
+        return parse_rules(rules_file, rules_filename)
+
+
+def guess_pos(label, features, has_arguments):
+    """
+    Guesses the part of speech of a predicate which neither has a pos feature nor is in the lexicon.
+
+    :param label: the predicate name, with underscores between words
+    :type label: str
+    :param features: its features
+    :type features: dict
+    :param has_arguments: whether it takes arguments
+    :type has_arguments: bool
+    :rtype: str
+    """
+    if "mood" in features or "form" in features and features["form"] != "plural":
+        return "v"
+    if "det" in features:
+        return "n"
+    word = label.rsplit("_", 1)[-1].lower()
+    if word in PREPOSITIONS:
+        return "prep"
+    if word.endswith(ADVERB_SUFFIXES):
+        return "adv"
+    if word.endswith(ADJECTIVE_SUFFIXES):
+        return "adj"
+    return "v" if has_arguments else "n"
+
+
+class SentPlanCompiler(object):
+    def __init__(self, rules=None, lexicon=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Compiles SentPlans into DependencyTrees with dependency_label features, which realize accepts.
+
+        Each predicate becomes a node and each argument a child, attached with the dependency label
+        of the first matching arg rule. Features such as det=def add function words, a value the
+        feature rules do not know is an error, and the plan features are copied onto the nodes, so
+        mood and form reach the compliance checker and the morphology. Plans are compiled bottom-up
+        with an explicit stack into immutable tree shapes, and the shape of every sub-plan is kept in
+        an LRU cache keyed by its label, features and compiled arguments, so a sub-plan seen before
+        costs one lookup. Each call to compile builds fresh nodes from the shape, so the trees it
+        returns share nothing and can be edited in place.
+
+        :param rules: defaults to the rules in sentplan_rules.tsv
+        :type rules: CompilationRules
+        :param lexicon: where parts of speech are looked up; defaults to the shared STE lexicon
+        :type lexicon: lexicon.Lexicon
+        :param cache_size: number of compiled sub-plans to keep, or 0 for no caching
+        :type cache_size: int
+        """
+        if rules is None:
+            rules = load_rules()
+        if lexicon is None:
+            lexicon = get_lexicon()
+        self.rules = rules
+        self.lexicon = lexicon
+        self.cache = RealizationCache(cache_size) if cache_size else None
+        # Every compiled sub-plan gets a serial number which is never reused, so cache keys can
+        # name the arguments of a plan without holding on to them
+        self._serials = itertools.count()
+
+    def pos_of(self, label, features, has_arguments):
+        """
+        :return: the part of speech of a predicate: its pos feature, else its lexicon tag, else a guess
+        :rtype: str
+        """
+        pos = features.get("pos")
+        if pos is not None:
+            return pos
+        for tag in self.lexicon.pos_tags(label.replace("_", " ").lower()):
+            pos = self.rules.pos_by_tag.get(tag)
+            if pos is not None:
+                return pos
+        return guess_pos(label, features, has_arguments)
+
+    def compile(self, sentplan):
+        """
+        :param sentplan: the plan to compile
+        :type sentplan: sentplan.SentPlan
+        :return: the root of the dependency tree, with dependency_label ROOT
+        :rtype: DependencyTree
+        """
+        compiled = {}
+        stack = [(sentplan, False)]
+        while stack:
+            plan, arguments_done = stack.pop()
+            if arguments_done:
+                compiled[id(plan)] = self._compile_node(plan, [compiled.pop(id(argument)) for argument in plan])
+            else:
+                stack.append((plan, True))
+                stack.extend((argument, False) for argument in plan)
+        label, features, children = compiled[id(sentplan)][0]
+        end_words = tuple((word, (("dependency_label", dep), ), ()) for word, dep in self.rules.end_words)
+        return _build_tree((label, features + (("dependency_label", "ROOT"), ), children + end_words))
+
+    def _compile_node(self, plan, arguments):
+        label = plan.label()
+        features = plan.features
+        # Sorted, so plans differing only in the order of their features compile, and cache, alike
+        feature_items = tuple(sorted(features.items()))
+        key = None
+        if self.cache is not None:
+            key = (label, feature_items, tuple(argument[1] for argument in arguments))
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+
+        pos = self.pos_of(label, features, bool(arguments))
+        words = label.split("_")
+        # Shapes are (label, feature items, child shapes) tuples, never changed once made
+        children = []
+        if len(words) > 1:
+            head, dep = self.rules.split(pos)
+            if head == "first":
+                label, others = words[0], words[1:]
+            else:
+                label, others = words[-1], words[:-1]
+            children.extend((word, (("dependency_label", dep), ), ()) for word in others)
+        for word, dep in self.rules.function_words(feature_items):
+            children.append((word, (("dependency_label", dep), ), ()))
+        mood = features.get("mood")
+        for position, (shape, _, argument_pos) in enumerate(arguments):
+            dep, function_word = self.rules.argument(pos, mood, position, argument_pos)
+            if function_word is not None:
+                children.append((function_word[0], (("dependency_label", function_word[1]), ), ()))
+            argument_label, argument_features, argument_children = shape
+            children.append((argument_label, argument_features + (("dependency_label", dep), ), argument_children))
+
+        entry = ((label, feature_items, tuple(children)), next(self._serials), pos)
+        if key is not None:
+            self.cache.put(key, entry)
+        return entry
+
+
+def _build_tree(shape):
+    label, features, children = shape
+    root = DependencyTree(label, features=dict(features))
+    stack = [(root, children)]
+    while stack:
+        node, children = stack.pop()
+        for label, features, grandchildren in children:
+            child = DependencyTree(label, features=dict(features))
+            node.append(child)
+            if grandchildren:
+                stack.append((child, grandchildren))
+    return root
+
+
+_compiler = None
+
+
+def get_compiler():
+    """
+    :return: the shared SentPlanCompiler with the default rules, created on first use
+    :rtype: SentPlanCompiler
+    """
+    global _compiler
+    if _compiler is None:
+        _compiler = SentPlanCompiler()
+    return _compiler
+
+
+def compile_plan(sentplan):
+    """
+    Compiles a SentPlan with the shared compiler; see SentPlanCompiler.compile.
+    """
+    return get_compiler().compile(sentplan)
+
+
+def _sentence(realization):
+    realization = _SPACE_BEFORE_PUNCTUATION.sub("", realization.strip())
+    return realization[:1].upper() + realization[1:]
+
+
+def realize_plans(sentplans, with_stemming=False, with_morphology=False, compiler=None):
+    """
+    :param sentplans: SentPlans, or pred-logic strings with features
+    :type sentplans: iterable
+    :param with_stemming: whether to stem node labels
+    :type with_stemming: bool
+    :param with_morphology: whether to inflect nodes with a form feature
+    :type with_morphology: bool
+    :param compiler: defaults to the shared compiler
+    :type compiler: SentPlanCompiler
+    :return: the realized sentences, capitalized and with punctuation attached to the word before it, in input order
+    :rtype: list
+    """
+    if compiler is None:
+        compiler = get_compiler()
+    deptrees = [compiler.compile(parse_pred_logic_to_sp(plan, with_features=True) if isinstance(plan, str) else plan)
+                for plan in sentplans]
+    return [_sentence(realization)
+            for realization in realize_batch(deptrees, with_stemming, with_morphology=with_morphology)]
+
+
+def iter_realized_plan_file(plan_filename, batch_size=DEFAULT_BATCH_SIZE, with_stemming=False,
+                            with_morphology=False, compiler=None):
+    """
+    Streams the realizations of a file holding one pred-logic string per line, in batches.
+
+    :param plan_filename: path to the file of plans
+    :type plan_filename: str
+    :param batch_size: number of plans realized together
+    :type batch_size: int
+    :return: generator over the realized sentences, in file order
+    """
+    plans = iter_pred_logic_file(plan_filename, with_features=True)
+    while True:
+        batch = list(itertools.islice(plans, batch_size))
+        if not batch:
+            return
+        yield from realize_plans(batch, with_stemming, with_morphology, compiler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Realize a file of pred-logic sentence plans, one per line.")
+    parser.add_argument("plans", nargs="?",
+                        help="the plan file (default: check that the README examples realize as documented)")
+    parser.add_argument("--rules", help="compilation rules file (default: sentplan_rules.tsv)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE,
+                        help="number of plans realized together")
+    parser.add_argument("--stem", action="store_true", help="stem node labels")
+    parser.add_argument("--morphology", action="store_true", help="inflect nodes with a form feature")
+    parser.add_argument("--benchmark", type=int, metavar="N",
+                        help="instead of printing, time parsing, compiling and realizing the plans repeated N times")
+    args = parser.parse_args()
+    compiler = SentPlanCompiler(load_rules(args.rules) if args.rules else None)
+
+    if args.plans:
+        with open(args.plans, 'r') as plan_file:
+            plan_strings = [line for line in plan_file if line.strip()]
+    else:
+        plan_strings = [plan for plan, _ in README_EXAMPLES]
+    if args.benchmark is None:
+        if not args.plans:
+            mismatches = 0
+            for (plan, expected), realization in zip(README_EXAMPLES,
+                                                     realize_plans(plan_strings, args.stem, args.morphology, compiler)):
+                print(realization)
+                if realization != expected:
+                    print("  expected: {}".format(expected))
+                    mismatches += 1
+            sys.exit(1 if mismatches else 0)
+        for realization in iter_realized_plan_file(args.plans, args.batch_size, args.stem, args.morphology, compiler):
+            print(realization)
+        sys.exit()
+
+    plan_strings = plan_strings * args.benchmark
+    for cache_size in (0, DEFAULT_CACHE_SIZE):
+        compiler = SentPlanCompiler(compiler.rules, cache_size=cache_size)
+        stage_seconds = {"parse": 0.0, "compile": 0.0, "realize": 0.0}
+        start_time = time.time()
+        for batch_start in range(0, len(plan_strings), args.batch_size):
+            stage_start = time.time()
+            sentplans = [parse_pred_logic_to_sp(plan, with_features=True)
+                         for plan in plan_strings[batch_start:batch_start + args.batch_size]]
+            stage_seconds["parse"] += time.time() - stage_start
+            stage_start = time.time()
+            deptrees = [compiler.compile(sentplan) for sentplan in sentplans]
+            stage_seconds["compile"] += time.time() - stage_start
+            stage_start = time.time()
+            realize_batch(deptrees, args.stem, with_morphology=args.morphology)
+            stage_seconds["realize"] += time.time() - stage_start
+        elapsed = time.time() - start_time
+        print("{} plans end to end, {}: {:.0f} plans/second ({})".format(
+            len(plan_strings), "sub-plan cache on" if cache_size else "no sub-plan cache",
+            len(plan_strings) / elapsed,
+            ", ".join("{} {:.3f} s".format(stage, seconds) for stage, seconds in stage_seconds.items())))
@@ -1,179 +1,377 @@
-import pickle
-<<<<<<< HEAD
-import time
-=======
->>>>>>> fef206fbe2be45f826184880970aca51825c6e75
-from deptree import DependencyTree
-from nltk.stem import *
-from nltk.stem.porter import *
+import argparse
+import os
+from functools import partial
 
-<<<<<<< HEAD
-from nltk.stem import *
-from nltk.stem.porter import *
+import profiling
+from compact_deptree import CompactDependencyTree
+from corpus import iter_examples
+from realization_cache import compact_subtree_digests, subtree_digests
+from linearization import NOUN_PHRASE, load_rules
+from morphology import FORM_FEATURE, inflect
+from parallel import DEFAULT_CHUNK_SIZE, map_chunks
+from stemming import lexicon_stemmer
 
+stemmer = lexicon_stemmer()
+profiling.watch_cache("stemmer", stemmer)
 
-print("Loading spaCy for English...")
-start_time = time.time()
+# Where each child is placed relative to its head; replace with load_rules(filename) to change the word order
+linearization_rules = load_rules()
 
-import spacy
-en_nlp = spacy.load('en')
-=======
-stemmer = PorterStemmer()
->>>>>>> fef206fbe2be45f826184880970aca51825c6e75
-
-
-def realize(deptree, with_stemming=True):
+def realize(deptree, with_stemming=True, cache=None, with_morphology=False):
     """
 
     :param deptree:
-    :type deptree: DependencyTree
+    :type deptree: DependencyTree or CompactDependencyTree
+    :param cache: reuse realizations of subtrees seen before
+    :type cache: RealizationCache
+    :param with_morphology: inflect the labels of nodes with a ``form`` feature, e.g. form=past
+    :type with_morphology: bool
     :return:
     """
-    if deptree.features.get("dependency_label") in ("nsubj", "dobj", "conj", "compound"):
-        return realize_noun_phrase(deptree, with_stemming)
+    if profiling.enabled:
+        return _profiled_realize(deptree, with_stemming, cache, with_morphology)
+    return " ".join(_realize_tokens(deptree, with_stemming, cache, with_morphology))
+
+
+def realize_batch(deptrees, with_stemming=True, cache=None, with_morphology=False):
+    """
+    Realizes many DependencyTrees in one call.
+
+    Each tree is linearized into a flat token list in a single pass and joined once,
+    so the cost per sentence is linear in the number of nodes.
+
+    :param deptrees: the DependencyTrees or CompactDependencyTrees to realize
+    :type deptrees: iterable
+    :param with_stemming: whether to stem node labels
+    :type with_stemming: bool
+    :param cache: reuse realizations of subtrees seen before
+    :type cache: RealizationCache
+    :param with_morphology: inflect the labels of nodes with a ``form`` feature
+    :type with_morphology: bool
+    :return: one realized string per tree, in input order
+    :rtype: list
+    """
+    if profiling.enabled:
+        return [_profiled_realize(deptree, with_stemming, cache, with_morphology) for deptree in deptrees]
+    return [" ".join(_realize_tokens(deptree, with_stemming, cache, with_morphology)) for deptree in deptrees]
+
+
+def realize_parallel(deptrees, processes=None, chunk_size=DEFAULT_CHUNK_SIZE, with_stemming=True,
+                     with_morphology=False):
+    """
+    Realizes a stream of DependencyTrees across a pool of worker processes.
+
+    Trees are sent to the workers in chunks as described in parallel.map_chunks, so
+    arbitrarily long streams can be realized without holding them in memory.
+
+    :param deptrees: the trees to realize
+    :type deptrees: iterable
+    :param processes: number of worker processes; defaults to one per CPU core
+    :type processes: int
+    :param chunk_size: number of trees sent to a worker per task
+    :type chunk_size: int
+    :param with_stemming: whether to stem node labels
+    :type with_stemming: bool
+    :param with_morphology: inflect the labels of nodes with a ``form`` feature
+    :type with_morphology: bool
+    :return: generator over realized strings, in input order
+    """
+    realize_chunk = partial(realize_batch, with_stemming=with_stemming, with_morphology=with_morphology)
+    return map_chunks(realize_chunk, deptrees, processes, chunk_size)
+
+
+def _profiled_realize(deptree, with_stemming, cache, with_morphology):
+    if cache is not None:
+        profiling.watch_cache("realization", cache)
+    start_time = profiling.timer()
+    tokens = _realize_tokens(deptree, with_stemming, cache, with_morphology)
+    profiling.record("realize.linearize", start_time)
+    start_time = profiling.timer()
+    realization = " ".join(tokens)
+    profiling.record("realize.join", start_time)
+    return realization
+
+
+def _realize_tokens(deptree, with_stemming, cache=None, with_morphology=False):
+    tokens = []
+    if isinstance(deptree, CompactDependencyTree):
+        children = deptree.children()
+        digests = compact_subtree_digests(deptree, children) if cache is not None else None
+        surfaces = _inflected_compact_heads(deptree) if with_morphology else None
+        _append_compact_tokens(deptree, 0, children, with_stemming, tokens, cache, digests, surfaces)
     else:
-<<<<<<< HEAD
-        root = spacy_doc
-    dt = DependencyTree(str(root))
-    dt.features['dependency_label'] = en_nlp.vocab[root.dep].orth_
-    for child in root.children:
-        child_tree = from_spacy_sentence(child, find_root=False)
-        dt.append(child_tree)
-    return dt
-
-
-def realize(deptree):
-    out_string = deptree.label()
-    stemmer = PorterStemmer()
-    out_string = stemmer.stem(out_string)	
-    left_edge_buffer = []
-    left_mid_buffer = []
-    left_buffer = []
+        digests = subtree_digests(deptree) if cache is not None else None
+        surfaces = _inflected_heads(deptree) if with_morphology else None
+        _append_tokens(deptree, with_stemming, tokens, cache, digests, surfaces)
+    return tokens
+
+
+def _inflected_heads(deptree):
+    # Inflects every node of the sentence with a form feature in one batch, keyed by id() of the node
+    nodes = []
+    stack = [deptree]
+    while stack:
+        node = stack.pop()
+        if FORM_FEATURE in node.features:
+            nodes.append(node)
+        stack.extend(node)
+    surfaces = inflect([node.label() for node in nodes], [node.features[FORM_FEATURE] for node in nodes])
+    return {id(node): surface for node, surface in zip(nodes, surfaces)}
+
+
+def _inflected_compact_heads(tree):
+    # As _inflected_heads, keyed by node index
+    if not tree.extra_features:
+        return {}
+    indices = [index for index, features in tree.extra_features.items() if FORM_FEATURE in features]
+    surfaces = inflect([tree.label(index) for index in indices],
+                       [tree.extra_features[index][FORM_FEATURE] for index in indices])
+    return dict(zip(indices, surfaces))
+
+
+def _cache_key(digest, with_stemming, prefix=b"", surfaces=None):
+    return (prefix + digest + (b"s" if with_stemming else b"-") + (b"-" if surfaces is None else b"m")
+            + linearization_rules.fingerprint)
+
+
+def _append_tokens(deptree, with_stemming, tokens, cache=None, digests=None, surfaces=None):
+    _drain_stack([deptree], with_stemming, tokens, cache, digests, surfaces)
+
+
+def _drain_stack(stack, with_stemming, tokens, cache, digests, surfaces=None):
+    # The tree is walked with an explicit stack instead of recursion, so its depth is not bounded
+    # by the interpreter's recursion limit. The stack holds nodes still to be expanded, realized
+    # head words waiting for their turn, and (key, start) markers which are popped once everything
+    # pushed after them is done, at which point tokens[start:] is the realization of that subtree.
+    phrase_for = linearization_rules.phrase_for
+    pop = stack.pop
+    emit = tokens.append
+    while stack:
+        item = pop()
+        item_type = type(item)
+        if item_type is str:
+            emit(item)
+            continue
+        if item_type is tuple:
+            cache.put(item[0], tuple(tokens[item[1]:]))
+            continue
+        if cache is not None:
+            key = _cache_key(digests[id(item)], with_stemming, surfaces=surfaces)
+            cached = cache.get(key)
+            if cached is not None:
+                tokens.extend(cached)
+                continue
+            if item:
+                stack.append((key, len(tokens)))
+        if item:
+            _push_phrase(item, phrase_for(item.features.get("dependency_label")), with_stemming, stack, surfaces)
+            continue
+        # A leaf realizes as its own label, so it is emitted without a round trip through the stack
+        if profiling.enabled:
+            profiling.count("dependency_label", item.features.get("dependency_label"))
+        if surfaces and id(item) in surfaces:
+            emit(surfaces[id(item)])
+        else:
+            emit(stemmer.stem(item.label()) if with_stemming else item.label())
+        if cache is not None:
+            cache.put(key, (tokens[-1], ))
+
+
+def _push_phrase(deptree, phrase_rules, with_stemming, stack, surfaces=None):
+    if profiling.enabled:
+        profiling.count("dependency_label", deptree.features.get("dependency_label"))
+    if surfaces and id(deptree) in surfaces:
+        head = surfaces[id(deptree)]
+    elif with_stemming:
+        head = stemmer.stem(deptree.label())
+    else:
+        head = deptree.label()
+    if profiling.enabled:
+        start_time = profiling.timer()
+    # Slots stay None until a child is placed in them, as most nodes fill only one or two
+    buffers = [None] * len(phrase_rules.slots)
+    by_word_get = phrase_rules.by_word.get
+    by_dependency_get = phrase_rules.by_dependency.get
+    default_slot = phrase_rules.default_slot
     for child in deptree:
-        attachment_decision = where_to_attach(child)
-        if attachment_decision == -3:
-            left_edge_buffer.append(realize(child))
-        elif attachment_decision == -2:
-            left_mid_buffer.append(realize(child))
-        elif attachment_decision == -1:
-            left_buffer.append(realize(child))
-        elif attachment_decision == 1:
-            out_string = out_string + " " + realize(child)
-    for buffer in left_buffer, left_mid_buffer, left_edge_buffer:
-        if buffer:
-            out_string = " ".join(buffer) + " " + out_string
-    return out_string
-=======
-        if with_stemming:
-            out_string = stemmer.stem(deptree.label())
+        slot = by_word_get(child.label())
+        if slot is None:
+            slot = by_dependency_get(child.features.get("dependency_label"), default_slot)
+        buffer = buffers[slot]
+        if buffer is None:
+            buffers[slot] = [child]
         else:
-            out_string = deptree.label()
-        left_edge_buffer = []
-        left_mid_buffer = []
-        left_buffer = []
-        for child in deptree:
-            attachment_decision = where_to_attach(child)
-            if attachment_decision == -3:
-                left_edge_buffer.append(realize(child, with_stemming))
-            elif attachment_decision == -2:
-                left_mid_buffer.append(realize(child, with_stemming))
-            elif attachment_decision == -1:
-                left_buffer.append(realize(child, with_stemming))
-            elif attachment_decision == 1:
-                out_string = out_string + " " + realize(child, with_stemming)
-        for buffer in left_buffer, left_mid_buffer, left_edge_buffer:
+            buffer.append(child)
+    if profiling.enabled:
+        # the realizer's own attachment decisions, made a phrase at a time
+        profiling.record("where_to_attach", start_time)
+    _push_buffers(buffers, phrase_rules, head, stack)
+
+
+def _push_buffers(buffers, phrase_rules, head, stack):
+    if profiling.enabled:
+        for slot, buffer in enumerate(buffers):
             if buffer:
-                out_string = " ".join(buffer) + " " + out_string
-        return out_string
->>>>>>> fef206fbe2be45f826184880970aca51825c6e75
+                profiling.count("attachment", phrase_rules.name + ":" + phrase_rules.slots[slot], len(buffer))
+    # Pushed in reverse, so they are popped from the leftmost slot to the rightmost
+    for slot in phrase_rules.push_order:
+        if slot is None:
+            stack.append(head)
+        else:
+            buffer = buffers[slot]
+            if buffer is not None:
+                stack.extend(reversed(buffer))
 
 
 def where_to_attach(deptree):
     """
+    Where a child goes relative to its head in a clause, under the current linearization rules.
 
     :param deptree:
     :type deptree: DependencyTree
-    :return:
+    :return: the child's slot position minus the head's, e.g. -3 for the left edge and 1 for the right
     """
-    dep = deptree.features.get("dependency_label")
-    if dep in ("det", "mark") or deptree.label() in ("when", ):
-        return -3
-    elif dep in ("nsubj", "nsubjpass", "amod", "nummod"):
-        return -2
-    elif dep in ("aux", "auxpass", "neg", "compound"):
-        return -1
-    else:
-        return 1
+    if profiling.enabled:
+        start_time = profiling.timer()
+        attachment_decision = _attachment(deptree)
+        profiling.record("where_to_attach", start_time)
+        return attachment_decision
+    return _attachment(deptree)
 
 
-def realize_noun_phrase(deptree, with_stemming=True):
-    if with_stemming:
-        noun = stemmer.stem(deptree.label())
-    else:
-        noun = deptree.label()
-    out_string = noun
-    det = []
-    amod = []
-    compound = []
-    prep = []
-    cc = []
-    conj = []
-    for child in deptree:
-        dep = child.features.get("dependency_label")
-        if dep == "det":
-            det.append(realize(child, with_stemming))
-        elif dep in ("amod", "nummod"):
-            amod.append(realize(child, with_stemming))
-        elif dep in ("compound", ):
-            compound.append(realize(child, with_stemming))
-        elif dep in ("prep", ):
-            prep.append(realize(child, with_stemming))
-        elif dep == "cc":
-            cc.append(realize(child, with_stemming))
-        elif dep == "conj":
-            conj.append(realize(child, with_stemming))
+def _attachment(deptree):
+    clause = linearization_rules.default_phrase
+    return clause.slot(deptree.label(), deptree.features.get("dependency_label")) - clause.head_slot
+
+
+def realize_noun_phrase(deptree, with_stemming=True, cache=None, with_morphology=False):
+    tokens = []
+    stack = []
+    digests = None
+    surfaces = _inflected_heads(deptree) if with_morphology else None
+    if cache is not None:
+        digests = subtree_digests(deptree)
+        key = _cache_key(digests[id(deptree)], with_stemming, prefix=b"np", surfaces=surfaces)
+        cached = cache.get(key)
+        if cached is not None:
+            return " ".join(cached)
+        stack.append((key, 0))
+    noun_phrase = linearization_rules.phrases.get(NOUN_PHRASE, linearization_rules.default_phrase)
+    _push_phrase(deptree, noun_phrase, with_stemming, stack, surfaces)
+    _drain_stack(stack, with_stemming, tokens, cache, digests, surfaces)
+    return " ".join(tokens)
+
+
+def _append_compact_tokens(tree, index, children, with_stemming, tokens, cache=None, digests=None, surfaces=None):
+    # Same traversal as _drain_stack, with node indices on the stack in place of nodes
+    label_of = tree.label
+    dependency_label_of = tree.dependency_label
+    phrase_for = linearization_rules.phrase_for
+    stack = [index]
+    pop = stack.pop
+    emit = tokens.append
+    while stack:
+        item = pop()
+        item_type = type(item)
+        if item_type is str:
+            emit(item)
+            continue
+        if item_type is tuple:
+            cache.put(item[0], tuple(tokens[item[1]:]))
+            continue
+        child_indices = children[item]
+        if cache is not None:
+            key = _cache_key(digests[item], with_stemming, surfaces=surfaces)
+            cached = cache.get(key)
+            if cached is not None:
+                tokens.extend(cached)
+                continue
+            if child_indices:
+                stack.append((key, len(tokens)))
+        label = label_of(item)
+        dep = dependency_label_of(item)
+        if profiling.enabled:
+            profiling.count("dependency_label", dep)
+        if surfaces and item in surfaces:
+            head = surfaces[item]
+        elif with_stemming:
+            head = stemmer.stem(label)
         else:
-            amod.append(realize(child, with_stemming))
-    for buffer in det, amod, compound:
-        if buffer:
-            out_string = " ".join(buffer) + " " + out_string
-    for buffer in prep, cc, conj:
-        if buffer:
-            out_string = out_string + " " + " ".join(buffer)
-    return out_string
-        
+            head = label
+        if not child_indices:
+            emit(head)
+            if cache is not None:
+                cache.put(key, (head, ))
+            continue
+        if profiling.enabled:
+            start_time = profiling.timer()
+        phrase_rules = phrase_for(dep)
+        buffers = [None] * len(phrase_rules.slots)
+        by_word_get = phrase_rules.by_word.get
+        by_dependency_get = phrase_rules.by_dependency.get
+        default_slot = phrase_rules.default_slot
+        for child in child_indices:
+            slot = by_word_get(label_of(child))
+            if slot is None:
+                slot = by_dependency_get(dependency_label_of(child), default_slot)
+            buffer = buffers[slot]
+            if buffer is None:
+                buffers[slot] = [child]
+            else:
+                buffer.append(child)
+        if profiling.enabled:
+            profiling.record("where_to_attach", start_time)
+        _push_buffers(buffers, phrase_rules, head, stack)
+
 
 if __name__ == "__main__":
-<<<<<<< HEAD
-    examples = []
-    with open("ste100.sents", 'r') as example_file:
-        line_count = 0
-        for line in example_file:
-            line_count += 1
-            print("Processing example {}".format(line_count))
-            print(line)
-            dt = from_spacy_sentence(en_nlp(line))
-            print(dt)
-            print(realize(dt))
-            print("----------------")
-            print()
-            examples.append((line, dt))
-    with open("ste100.pickle", 'wb') as ste_pickle:
-        pickle.dump(examples, ste_pickle)
-=======
+    parser = argparse.ArgumentParser(description="Realize a corpus of DependencyTrees.")
+    parser.add_argument("corpus", nargs="?",
+                        help="binary or pickled (sentence, DependencyTree) examples "
+                             "(default: ste100.corpus, or the older ste100.pickle cache)")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="realize in parallel with this many worker processes (0 for one per CPU core)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="number of trees sent to a worker process at a time")
+    parser.add_argument("--morphology", action="store_true",
+                        help="inflect nodes with a form feature, e.g. form=past, instead of leaving them as lemmas")
+    parser.add_argument("--rules", help="linearization rules file (default: linearization_rules.tsv)")
+    parser.add_argument("--profile",
+                        help="profile realization and write the report here (Prometheus text if it ends in .prom, "
+                             "JSON otherwise); only covers this process, not -j workers")
+    args = parser.parse_args()
+    if args.rules:
+        linearization_rules = load_rules(args.rules)
+    if args.profile:
+        profiling.enable()
+    if args.corpus is None:
+        args.corpus = "ste100.pickle" if os.path.exists("ste100.pickle") and not os.path.exists("ste100.corpus") \
+            else "ste100.corpus"
+
+    if args.processes != 1:
+        trees = (example[1] for example in iter_examples(args.corpus))
+        for realization in realize_parallel(trees, args.processes or None, args.chunk_size, with_stemming=False,
+                                            with_morphology=args.morphology):
+            print(realization)
+        if args.profile:
+            profiling.dump(args.profile)
+        raise SystemExit
+
     try:
-        with open("ste100.pickle", 'rb') as ste_pickle:
-            examples = pickle.load(ste_pickle)
+        examples = list(iter_examples(args.corpus))
     except FileNotFoundError:
         from load_from_spacy import load_examples
-        examples = load_examples("ste100.sents")
+        examples = load_examples(".".join(args.corpus.split(".")[:-1]) + ".sents")
     print(examples[0][0])
     print(examples[0][1])
     print(realize(examples[0][1]))
     print(realize(examples[0][1], with_stemming=False))
-    for example in examples:
+    realizations = realize_batch((example[1] for example in examples), with_stemming=False,
+                                 with_morphology=args.morphology)
+    for example, realization in zip(examples, realizations):
         print(example[0])
         print(example[1])
-        print(realize(example[1], with_stemming=False))
+        print(realization)
         print()
->>>>>>> fef206fbe2be45f826184880970aca51825c6e75
+    if args.profile:
+        profiling.dump(args.profile)
@@ -0,0 +1,125 @@
+import pickle
+import time
+from functools import lru_cache
+from types import MappingProxyType
+
+from nltk.stem.porter import PorterStemmer
+
+import profiling
+from lexicon import get_lexicon
+
+DEFAULT_CACHE_SIZE = 65536
+
+
+def lexicon_words(lexicon=None):
+    """
+    :param lexicon: defaults to the shared STE lexicon
+    :type lexicon: lexicon.Lexicon
+    :return: every word in the lexicon entries, with multi-word entries split into their words
+    :rtype: set
+    """
+    if lexicon is None:
+        lexicon = get_lexicon()
+    words = set()
+    for entry in lexicon.words():
+        words.update(entry.split())
+    return words
+
+
+def build_stem_table(words, stemmer=None):
+    """
+    Precomputes the stems of a vocabulary into a read-only lookup table.
+
+    :param words: the words to stem
+    :type words: iterable
+    :param stemmer: defaults to nltk's PorterStemmer
+    :return: mapping from each word to its stem
+    :rtype: types.MappingProxyType
+    """
+    if stemmer is None:
+        stemmer = PorterStemmer()
+    return MappingProxyType({word: stemmer.stem(word) for word in words})
+
+
+class CachedStemmer(object):
+    def __init__(self, stem_table=None, cache_size=DEFAULT_CACHE_SIZE):
+        """
+        Porter stemmer which looks words up in a precomputed table before stemming them,
+        and remembers the stems of words missing from the table in a bounded LRU cache.
+
+        :param stem_table: precomputed stems, e.g. from build_stem_table
+        :type stem_table: mapping
+        :param cache_size: number of stems of unseen words to remember
+        :type cache_size: int
+        """
+        self.stem_table = stem_table if stem_table is not None else {}
+        self._porter_stemmer = PorterStemmer()
+        self._cached_stem = lru_cache(maxsize=cache_size)(self._porter_stemmer.stem)
+
+    def stem(self, word):
+        if profiling.enabled:
+            return self._profiled_stem(word)
+        stem = self.stem_table.get(word)
+        if stem is None:
+            stem = self._cached_stem(word)
+        return stem
+
+    def _profiled_stem(self, word):
+        start_time = profiling.timer()
+        stem = self.stem_table.get(word)
+        if stem is None:
+            stem = self._cached_stem(word)
+            profiling.count("stem_source", "porter")
+        else:
+            profiling.count("stem_source", "table")
+        profiling.record("stem", start_time)
+        return stem
+
+    def cache_info(self):
+        return self._cached_stem.cache_info()
+
+
+def lexicon_stemmer(cache_size=DEFAULT_CACHE_SIZE):
+    """
+    :return: a CachedStemmer preloaded with the stems of the whole STE lexicon
+    :rtype: CachedStemmer
+    """
+    return CachedStemmer(build_stem_table(lexicon_words()), cache_size)
+
+
+if __name__ == "__main__":
+    import ste_realization
+
+    repeats = 5
+    with open("ste100.pickle", 'rb') as ste_pickle:
+        trees = [example[1] for example in pickle.load(ste_pickle)] * 500
+
+    def time_realization(with_stemming):
+        # one warm-up pass, then the fastest of several, since a single pass of a fraction of a second is noise
+        ste_realization.realize_batch(trees, with_stemming)
+        elapsed_times = []
+        for _ in range(repeats):
+            start_time = time.perf_counter()
+            ste_realization.realize_batch(trees, with_stemming)
+            elapsed_times.append(time.perf_counter() - start_time)
+        return min(elapsed_times)
+
+    # The lexicon only has the a, g, p and q words so far, so most corpus words miss the table
+    # and are answered by the LRU cache instead
+    corpus_words = set()
+    stack = list(trees)
+    while stack:
+        node = stack.pop()
+        corpus_words.add(node.label())
+        stack.extend(node)
+    table_words = lexicon_words()
+    print("The stem table covers {} of the {} distinct words in the corpus".format(
+        len(corpus_words & table_words), len(corpus_words)))
+
+    unstemmed_time = time_realization(False)
+    print("Realizing {} trees without stemming: {:.3f} seconds".format(len(trees), unstemmed_time))
+    for name, stemmer in (("PorterStemmer", PorterStemmer()), ("CachedStemmer", lexicon_stemmer())):
+        ste_realization.stemmer = stemmer
+        stemmed_time = time_realization(True)
+        print("Realizing {} trees with {}: {:.3f} seconds, stemming is {:.1%} of realization time".format(
+            len(trees), name, stemmed_time, max(stemmed_time - unstemmed_time, 0.0) / stemmed_time))
@@ -0,0 +1,96 @@
+from collections import namedtuple
+
+from lexicon import get_lexicon
+
+# Trie key marking that the tokens leading to a node form a complete term
+_TERM = None
+
+SentenceMatch = namedtuple("SentenceMatch", ["terms", "unapproved"])
+SentenceMatch.__doc__ = """
+Result of matching one sentence against the lexicon.
+
+terms holds a (start, end, term) triple for every approved multi-word term, with token offsets.
+unapproved holds an (index, token) pair for every word that is not approved.
+"""
+
+
+class TermMatcher(object):
+    def __init__(self, lexicon=None):
+        """
+        Token trie over the lexicon entries, for finding approved terms in realized text.
+
+        :param lexicon: defaults to the shared STE lexicon
+        :type lexicon: lexicon.Lexicon
+        """
+        if lexicon is None:
+            lexicon = get_lexicon()
+        self.trie = {}
+        prefixes = set()
+        for term in lexicon.words():
+            if term.endswith("-"):
+                prefixes.add(term)
+                continue
+            node = self.trie
+            for token in term.lower().split():
+                node = node.setdefault(token, {})
+            node[_TERM] = term
+        self.prefixes = tuple(sorted(prefixes, key=len, reverse=True))
+
+    def _longest_term(self, tokens, start):
+        node = self.trie
+        term = None
+        end = start
+        for index in range(start, len(tokens)):
+            node = node.get(tokens[index])
+            if node is None:
+                break
+            if _TERM in node:
+                term = node[_TERM]
+                end = index + 1
+        return term, end
+
+    def _is_prefixed_word(self, token):
+        for prefix in self.prefixes:
+            if token.startswith(prefix):
+                rest = self.trie.get(token[len(prefix):])
+                return rest is not None and _TERM in rest
+        return False
+
+    def match(self, sentence):
+        """
+        Finds the approved multi-word terms and the unapproved words of a sentence in one pass.
+
+        The sentence is split on whitespace, as ste_realization produces it. At each position the
+        longest approved term is taken, so the work per token is bounded by the longest term in
+        the lexicon. Tokens without letters, such as punctuation and numbers, are never flagged.
+
+        :param sentence: a realized sentence
+        :type sentence: str
+        :rtype: SentenceMatch
+        """
+        words = sentence.split()
+        tokens = [word.lower() for word in words]
+        terms = []
+        unapproved = []
+        index = 0
+        while index < len(tokens):
+            term, end = self._longest_term(tokens, index)
+            if term is None:
+                token = tokens[index]
+                if any(char.isalpha() for char in token) and not self._is_prefixed_word(token):
+                    unapproved.append((index, words[index]))
+                index += 1
+            else:
+                if end - index > 1:
+                    terms.append((index, end, term))
+                index = end
+        return SentenceMatch(terms, unapproved)
+
+    def match_document(self, sentences):
+        """
+        :param sentences: realized sentences, e.g. from ste_realization.realize_batch
+        :type sentences: iterable
+        :return: generator over one SentenceMatch per sentence
+        """
+        for sentence in sentences:
+            yield self.match(sentence)
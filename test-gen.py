@@ -1,58 +1,28 @@
-#/usr/bin/python
-import sys
-import re
-from nltk.corpus import wordnet as wn
-import time
-import nltk.data
+#!/usr/bin/env python
+from conllu import format_conllu
+from parser_backends import CONLL2009_COLUMNS, HTTPParserBackend
 
-import json
-import urllib2
-from pprint import pprint
-import xml.etree.ElementTree as ET
+PARSER_URL = "http://barbar.cs.lth.se:8081/parse"
 
-#import nltk.parse.dependencygraph
-from nltk.parse import DependencyGraph
 
+def parser_backend(url=PARSER_URL):
+    # The LTH service parses one sentence per request and answers in CoNLL-2009
+    return HTTPParserBackend(url, sentences_per_request=1, response_columns=CONLL2009_COLUMNS)
 
-def inputsentence_analysis(inputsentence):
-	post_data = "sentence="+inputsentence
-        url=urllib2.urlopen("http://barbar.cs.lth.se:8081/parse",data=post_data)
-        returncode = url.getcode()
-        content = url.read()
 
+def inputsentence_analysis(inputsentences, backend=None):
+    if backend is None:
+        backend = parser_backend()
+    for inputsentence, tree in zip(inputsentences, backend.parse_batch(inputsentences)):
+        print(tree)
+        print(format_conllu(inputsentence, tree))
 
-        #if returncode != 200:
-         #       print >> log,'NLP server error (problem processing)'
-
-        #print content
-	#print type(content)
-
-
-
-        content=content.split('\n')
-        sent=""
-        #result={}
-        #SemPar = 0
-        #NoSbj = 0
-        #print "data is", repr(content)
-	#print content	
-
-        for row in content:
-                table=row.split('\t')
-                #sent.append([table[0], table[1], table[2], table[4],  table[5], table[6], table[8], table[10], table[12], table[13], "\n"])
-                sent+=table[0]+"\t"+table[1]+"\t"+table[2]+"\t"+table[4]+"\t"+table[5]+"\t"+table[6]+"\t"+table[8]+"\t"+table[10]+"\t"+table[12]+"\t"+table[13]+"\n"
-		#sent+=table[0]+"\t"+table[1]+"\n"
-	print sent
-	dg = DependencyGraph(sent)
-	tree = dg.tree()
-	print tree.pprint()
-	#print(dg)
-	print(dg.to_conll(4))
 
 def demo():
-        inputsentences = "Install the spacer between the two washers."
-	inputsentence_analysis(inputsentences)
+    inputsentences = ["Install the spacer between the two washers."]
+    with parser_backend() as backend:
+        inputsentence_analysis(inputsentences, backend)
 
-if __name__=="__main__":
-        demo()
 
+if __name__ == "__main__":
+    demo()
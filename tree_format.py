@@ -0,0 +1,116 @@
+from nltk.tree import Tree
+
+
+def pformat_tree(tree, margin=70, indent=0, nodesep='', parens='()', quotes=False, with_features=True,
+                 tree_type=Tree):
+    """
+    Pretty-prints a feature-bearing tree, producing the same output as DependencyTree.pformat.
+
+    :param tree: the DependencyTree or SentPlan to format
+    :param tree_type: children of this type are formatted as subtrees, any others as leaves
+    :type tree_type: type
+    :return: A pretty-printed string representation of the tree.
+    :rtype: str
+
+    The other parameters are those of DependencyTree.pformat.
+    """
+    parts = []
+    write_pformat(tree, parts.append, margin, indent, nodesep, parens, quotes, with_features, tree_type)
+    return "".join(parts)
+
+
+def write_pformat(tree, write, margin=70, indent=0, nodesep='', parens='()', quotes=False, with_features=True,
+                  tree_type=Tree):
+    """
+    Writes the pretty-printed form of a tree piece by piece.
+
+    The one-line width of every subtree is measured once, bottom-up, so deciding where to
+    break lines never formats a subtree twice and the whole tree is written in linear time.
+    Both passes use explicit stacks, so deep trees do not hit the recursion limit.
+
+    :param tree: the DependencyTree or SentPlan to format
+    :param write: called with each piece of output, e.g. ``sys.stdout.write`` or ``list.append``
+    :type write: callable
+    :param tree_type: children of this type are formatted as subtrees, any others as leaves
+    :type tree_type: type
+
+    The other parameters are those of DependencyTree.pformat.
+    """
+    heads, widths = _measure(tree, nodesep, parens, quotes, with_features, tree_type)
+    close = parens[1]
+    # Work items are strings to write, or (subtree, indent) pairs; indent None means one line
+    stack = [(tree, indent)]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            write(item)
+            continue
+        node, node_indent = item
+        if not isinstance(node, tree_type):
+            write(_leaf_string(node, quotes))
+            continue
+        write(heads[id(node)])
+        if node_indent is None or widths[id(node)] + node_indent < margin:
+            stack.append(close)
+            if not len(node):
+                stack.append(" ")
+            for position in range(len(node) - 1, -1, -1):
+                stack.append((node[position], None))
+                stack.append(" ")
+        else:
+            stack.append(close)
+            child_indent = node_indent + 2
+            newline = '\n' + ' ' * child_indent
+            for position in range(len(node) - 1, -1, -1):
+                stack.append((node[position], child_indent))
+                stack.append(newline)
+
+
+def pformat_flat(tree, nodesep, parens, quotes, with_features=True, tree_type=Tree):
+    """
+    :return: the one-line form of a tree
+    :rtype: str
+    """
+    parts = []
+    write_pformat(tree, parts.append, float('inf'), 0, nodesep, parens, quotes, with_features, tree_type)
+    return "".join(parts)
+
+
+def _measure(tree, nodesep, parens, quotes, with_features, tree_type):
+    heads = {}
+    widths = {}
+    stack = [(tree, False)]
+    while stack:
+        node, children_done = stack.pop()
+        if not children_done:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node if isinstance(child, tree_type))
+            continue
+        head = '%s%s%s' % (parens[0], _label_string(node, with_features), nodesep)
+        width = len(head) + 1 + len(parens[1]) + max(len(node) - 1, 0)
+        for child in node:
+            if isinstance(child, tree_type):
+                width += widths[id(child)]
+            else:
+                width += len(_leaf_string(child, quotes))
+        heads[id(node)] = head
+        widths[id(node)] = width
+    return heads, widths
+
+
+def _label_string(node, with_features):
+    label = node.label()
+    if isinstance(label, str):
+        if with_features:
+            return label + "".join(":{}={}".format(feature, value) for feature, value in node.features.items())
+        return label
+    return str(label)
+
+
+def _leaf_string(child, quotes):
+    if isinstance(child, tuple):
+        return "/".join(child)
+    elif isinstance(child, str) and not quotes:
+        return '%s' % child
+    else:
+        return str(child)